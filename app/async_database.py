@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+import asyncpg
+from app.database import POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE, POOL_TIMEOUT, STATEMENT_TIMEOUT_MS
+from app.metrics import record_query, record_acquire
+from app.repository import STORAGE_BACKEND, DELETE_PATIENT, update_patient_query
+from app.schemas import TUMOR_MEAN_COLUMNS, TUMOR_SE_COLUMNS, TUMOR_WORST_COLUMNS
+
+# Serve the patient CRUD endpoints through asyncpg (DB_ASYNC=0 keeps the blocking
+# repository path, which is also the only one for non-postgres storage backends)
+USE_ASYNC_DB = os.getenv("DB_ASYNC", "1") == "1" and STORAGE_BACKEND == "postgres"
+
+TUMOR_TABLES = {
+    "tumor_mean": TUMOR_MEAN_COLUMNS,
+    "tumor_se": TUMOR_SE_COLUMNS,
+    "tumor_worst": TUMOR_WORST_COLUMNS,
+}
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+def connection_params():
+    port = os.getenv("DB_PORT")
+    return {
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": int(port) if port else None,
+    }
+
+async def init_async_pool():
+    """Create the asyncpg pool if it does not exist yet."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                **connection_params(),
+                min_size=min(POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE),
+                max_size=ASYNC_POOL_MAX_SIZE,
+                server_settings={"statement_timeout": str(STATEMENT_TIMEOUT_MS)},
+            )
+    return _pool
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+def pool_stats():
+    """Snapshot of asyncpg pool usage, reported next to the psycopg2 pool's."""
+    size = _pool.get_size() if _pool is not None else 0
+    idle = _pool.get_idle_size() if _pool is not None else 0
+    return {
+        "open": _pool is not None,
+        "in_use": size - idle,
+        "idle": idle,
+        "size": size,
+        "min_size": min(POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE),
+        "max_size": ASYNC_POOL_MAX_SIZE,
+    }
+
+# Pool checkout and statements are reported to the per-request metrics
+@asynccontextmanager
+async def _acquire():
+    start = time.perf_counter()
+    # Connect lazily when the pool could not be created at startup
+    pool = _pool or await init_async_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as conn:
+        record_acquire(time.perf_counter() - start)
+        yield conn
+
+async def _run(method, query, *args):
+    start = time.perf_counter()
+    try:
+        return await method(query, *args)
+    finally:
+        record_query(query, time.perf_counter() - start)
+
+async def _fetch_row(conn, query, *args):
+    row = await _run(conn.fetchrow, query, *args)
+    return dict(row) if row else None
+
+# A GET holds a single pooled connection; the tumor lookups run on it one after another
+async def _fetch_tumors(conn, patient_id):
+    return {
+        table: await _fetch_row(conn, f"SELECT * FROM {table} WHERE patient_id = $1", patient_id)
+        for table in TUMOR_TABLES
+    }
+
+async def fetch_patient(patient_id):
+    async with _acquire() as conn:
+        patient = await _fetch_row(conn, "SELECT * FROM patients WHERE id = $1", patient_id)
+        if not patient:
+            return None
+        return {"patient": patient, **await _fetch_tumors(conn, patient_id)}
+
+async def fetch_last_patient():
+    async with _acquire() as conn:
+        patient = await _fetch_row(conn, "SELECT * FROM patients ORDER BY serial_id DESC LIMIT 1")
+        if not patient:
+            return None
+        return {"patient": patient, **await _fetch_tumors(conn, patient["id"])}
+
+def _create_patient_query():
+    ctes = []
+    position = 3
+    for table, columns in TUMOR_TABLES.items():
+        values = ", ".join(f"${i}::float8" for i in range(position, position + len(columns)))
+        position += len(columns)
+        ctes.append(f"""
+        new_{table} AS (
+            INSERT INTO {table} (patient_id, {", ".join(columns)})
+            SELECT id, {values} FROM new_patient
+        )""")
+    return f"""
+        WITH new_patient AS (
+            INSERT INTO patients (id, diagnosis)
+            VALUES (COALESCE($1::varchar, next_patient_id()), $2)
+            RETURNING id
+        ),{",".join(ctes)}
+        SELECT id FROM new_patient
+    """
+
+# Insert a patient and its three tumor rows in a single round trip
+CREATE_PATIENT = _create_patient_query()
+
+async def insert_patient(patient):
+    """Insert a patient and its tumor rows, returning the (possibly allocated) ID."""
+    async with _acquire() as conn:
+        return await _run(
+            conn.fetchval, CREATE_PATIENT,
+            patient.id, patient.diagnosis,
+            *patient.tumor_mean.model_dump().values(),
+            *patient.tumor_se.model_dump().values(),
+            *patient.tumor_worst.model_dump().values(),
+        )
+
+async def update_patient(patient_id, changes):
+    """Apply the fields present in `changes` in one statement; False if the patient does not exist."""
+    query, params = update_patient_query(patient_id, changes, lambda position: f"${position}")
+    async with _acquire() as conn:
+        return await _run(conn.fetchval, query, *params)
+
+async def delete_patient(patient_id):
+    """Delete a patient (its tumor rows cascade) in one statement; False if the patient did not exist."""
+    async with _acquire() as conn:
+        deleted = await _run(conn.fetchval, DELETE_PATIENT.replace("%s", "$1"), patient_id)
+    return deleted is not None
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from fastapi.encoders import jsonable_encoder
+
+_MISSING = object()
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+class PredictionCache(LRUCache):
+    """LRUCache of (patient_id, model version) keys that is invalidated per patient.
+
+    invalidate() drops the patient's predictions for every model version, and
+    a prediction computed from features read before an invalidation is not
+    stored, like the generation check of RecordCache.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self._versions = {}
+        # patient_id -> [predictions in progress, invalidations since the first began]
+        self._loading = {}
+
+    def _insert(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._versions.setdefault(key[0], set()).add(key[1])
+        while len(self._data) > self.maxsize:
+            self._discard(self._data.popitem(last=False)[0])
+            self.evictions += 1
+
+    def put(self, key, value):
+        with self._lock:
+            self._insert(key, value)
+
+    def _discard(self, key):
+        versions = self._versions.get(key[0])
+        if versions is not None:
+            versions.discard(key[1])
+            if not versions:
+                del self._versions[key[0]]
+
+    def pop(self, key):
+        with self._lock:
+            self._discard(key)
+            return self._data.pop(key, None)
+
+    def invalidate(self, patient_id):
+        with self._lock:
+            for version in self._versions.pop(patient_id, ()):
+                self._data.pop((patient_id, version), None)
+            if patient_id in self._loading:
+                self._loading[patient_id][1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+            for loading in self._loading.values():
+                loading[1] += 1
+
+    @contextmanager
+    def loading(self, patient_id):
+        """Wrap reading and scoring a patient; yields store(key, value), a no-op once invalidated."""
+        with self._lock:
+            loading = self._loading.setdefault(patient_id, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+
+        def store(key, value):
+            with self._lock:
+                if loading[1] == generation:
+                    self._insert(key, value)
+
+        try:
+            yield store
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[patient_id]
+
+class MemoryBackend:
+    """In-process record storage: LRU-bounded with a per-entry expiry."""
+
+    def __init__(self, maxsize):
+        self._entries = LRUCache(maxsize)
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key)
+            return None
+        return value
+
+    async def set(self, key, value, ttl):
+        self._entries.put(key, (time.monotonic() + ttl, value))
+
+    async def delete(self, key):
+        self._entries.pop(key)
+
+    async def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+class RedisBackend:
+    """Record storage shared by all workers, on any client with the redis.asyncio API."""
+
+    def __init__(self, client, prefix="records:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        await self.client.set(self.prefix + key, json.dumps(jsonable_encoder(value)), px=int(ttl * 1000))
+
+    async def delete(self, key):
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+class RecordCache:
+    """Read-through cache that coalesces concurrent misses for the same key into one load."""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight = {}
+        # Bumped on every invalidation so loads that started earlier are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def _load(self, key, loader):
+        generation = self._generation
+        value = await loader()
+        if value is not None and generation == self._generation:
+            await self.backend.set(key, value, self.ttl)
+        return value
+
+    async def get_or_load(self, key, loader):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(
+                lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None
+            )
+        # A cancelled request must not cancel the load other requests are waiting on
+        return await asyncio.shield(task)
+
+    async def invalidate(self, *keys):
+        self._generation += 1
+        for key in keys:
+            self._inflight.pop(key, None)
+            await self.backend.delete(key)
+
+    async def clear(self):
+        self._generation += 1
+        self._inflight.clear()
+        await self.backend.clear()
+
+    def stats(self):
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "backend": self.backend.stats(),
+        }
+
+# Patient records served by GET /patients/{id} and /patients/last
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "5"))
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", "10000"))
+RECORD_CACHE_URL = os.getenv("RECORD_CACHE_URL")  # e.g. redis://localhost:6379/0, in-process when unset
+
+record_cache = RecordCache(MemoryBackend(RECORD_CACHE_SIZE), RECORD_CACHE_TTL)
+
+def configure_record_cache():
+    """Switch the record cache to Redis when RECORD_CACHE_URL is set."""
+    if RECORD_CACHE_URL:
+        import redis.asyncio
+
+        record_cache.backend = RedisBackend(redis.asyncio.from_url(RECORD_CACHE_URL))
+    return record_cache
+
+def patient_key(patient_id):
+    return f"patient:{patient_id}"
+
+LAST_PATIENT_KEY = "last_patient"
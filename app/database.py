@@ -1,23 +1,176 @@
 import os
+import threading
+import time
 import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import cursor as _BaseCursor
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from app.metrics import record_query, record_acquire
 
 # Load environment variables
 load_dotenv()
 
+# Pool sizing and timeouts (per worker process)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # ping connections idle longer than this
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# DB_POOL_MAX is the worker's whole connection budget. With DB_ASYNC=1 the asyncpg
+# pool (patient CRUD) gets DB_ASYNC_POOL_MAX of it, half by default, and this pool the rest
+ASYNC_POOL_MAX_SIZE = (
+    int(os.getenv("DB_ASYNC_POOL_MAX", str(max(1, POOL_MAX_SIZE // 2))))
+    if os.getenv("DB_ASYNC", "1") == "1" else 0
+)
+SYNC_POOL_MAX_SIZE = max(1, POOL_MAX_SIZE - ASYNC_POOL_MAX_SIZE)
+
+# Cursors that report each statement to the per-request metrics
+class _InstrumentedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+class TupleCursor(_InstrumentedCursorMixin, _BaseCursor):
+    pass
+
+class DictCursor(_InstrumentedCursorMixin, RealDictCursor):
+    pass
+
+_pool = None
+_slots = None
+_last_used = {}
+_stats_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "in_use": 0,
+    "discarded": 0,
+    "total_wait_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+}
+
+def _connection_params():
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "cursor_factory": DictCursor,
+        "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+    }
+
+def init_pool():
+    """Create the connection pool if it does not exist yet."""
+    global _pool, _slots
+    if _pool is None:
+        _pool = pool.ThreadedConnectionPool(
+            min(POOL_MIN_SIZE, SYNC_POOL_MAX_SIZE), SYNC_POOL_MAX_SIZE, **_connection_params()
+        )
+        # ThreadedConnectionPool fails instead of waiting when exhausted, so
+        # callers queue on this semaphore for a free slot.
+        _slots = threading.BoundedSemaphore(SYNC_POOL_MAX_SIZE)
+    return _pool
+
+def close_pool():
+    """Close every pooled connection (called on application shutdown)."""
+    global _pool, _slots
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+        _slots = None
+        _last_used.clear()
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_connection():
-    """Establish a connection to the PostgreSQL database."""
+    """Check a connection out of the pool. Return it with release_connection()."""
     try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            cursor_factory=RealDictCursor
-        )
+        init_pool()
+        start = time.perf_counter()
+        if not _slots.acquire(timeout=POOL_TIMEOUT):
+            print("Database Connection Error: timed out waiting for a pooled connection")
+            return None
+        waited = time.perf_counter() - start
+
+        try:
+            conn = _pool.getconn()
+            if not _is_healthy(conn):
+                _pool.putconn(conn, close=True)
+                with _stats_lock:
+                    _stats["discarded"] += 1
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+
+        record_acquire(time.perf_counter() - start)
+        with _stats_lock:
+            _stats["checkouts"] += 1
+            _stats["in_use"] += 1
+            _stats["total_wait_seconds"] += waited
+            _stats["max_wait_seconds"] = max(_stats["max_wait_seconds"], waited)
         return conn
     except Exception as e:
         print(f"Database Connection Error: {e}")
         return None
+
+def release_connection(conn):
+    """Return a connection to the pool, discarding it if it is broken."""
+    if conn is None or _pool is None:
+        return
+
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            # Never hand out a connection with an open transaction
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+    with _stats_lock:
+        _stats["in_use"] -= 1
+        if broken:
+            _stats["discarded"] += 1
+
+def pool_stats():
+    """Snapshot of pool usage for sizing the pool per worker."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["open"] = _pool is not None
+    stats["min_size"] = min(POOL_MIN_SIZE, SYNC_POOL_MAX_SIZE)
+    stats["max_size"] = SYNC_POOL_MAX_SIZE
+    stats["idle"] = len(_pool._pool) if _pool is not None else 0
+    stats["avg_wait_seconds"] = (
+        stats["total_wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    )
+    return stats
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+import asyncpg
+from app.async_database import connection_params
+
+# NOTIFY channel written by the notify_patient_insert() trigger in sqlSchema.sql
+FEED_CHANNEL = "patient_inserts"
+# Events buffered per subscriber; a subscriber that falls this far behind is disconnected
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "1000"))
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", "15"))
+FEED_RECONNECT_SECONDS = 5.0
+# serial_id is allocated at insert but visible at commit, so concurrent inserts
+# and write-behind batches can commit out of serial order. A resuming client is
+# sent again the patients up to this many serial IDs before its Last-Event-ID.
+FEED_BACKFILL_OVERLAP = int(os.getenv("FEED_BACKFILL_OVERLAP", "1000"))
+# Patient IDs remembered per subscriber to skip events it was already sent
+FEED_DEDUP_SIZE = int(os.getenv("FEED_DEDUP_SIZE", "10000"))
+
+class RecentIds:
+    """Bounded set of the patient IDs most recently sent to one subscriber."""
+
+    def __init__(self, maxsize=FEED_DEDUP_SIZE):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def add(self, patient_id):
+        """Remember `patient_id`; False if it was already sent."""
+        if patient_id in self._ids:
+            return False
+        self._ids[patient_id] = None
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+        return True
+
+class _Subscriber:
+    __slots__ = ("queue", "overflowed")
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=FEED_QUEUE_SIZE)
+        self.overflowed = False
+
+class PatientFeed:
+    """Fans new-patient notifications out to subscribers from one shared LISTEN connection."""
+
+    def __init__(self, channel=FEED_CHANNEL):
+        self.channel = channel
+        self._subscribers = set()
+        self._task = None
+        self._conn = None
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # Keep one LISTEN connection open, reconnecting after failures
+        while True:
+            lost = asyncio.Event()
+            try:
+                self._conn = await asyncpg.connect(**connection_params())
+                self._conn.add_termination_listener(lambda conn: lost.set())
+                await self._conn.add_listener(self.channel, self._on_notify)
+                await lost.wait()
+                print("Patient feed: LISTEN connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Patient feed error: {e}")
+            finally:
+                if self._conn is not None and not self._conn.is_closed():
+                    await self._conn.close()
+                self._conn = None
+            await asyncio.sleep(FEED_RECONNECT_SECONDS)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self.publish(json.loads(payload))
+        except ValueError as e:
+            print(f"Patient feed: invalid payload {payload!r}: {e}")
+
+    def publish(self, event):
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Never let one slow client hold events for everyone; it can
+                # reconnect with Last-Event-ID and backfill what it missed
+                subscriber.overflowed = True
+                self._subscribers.discard(subscriber)
+                self.dropped_subscribers += 1
+
+    def subscribe(self):
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def stats(self):
+        return {
+            "listening": self._conn is not None and not self._conn.is_closed(),
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+def format_event(event):
+    """One Server-Sent Event; the id lets clients resume with Last-Event-ID."""
+    return f"id: {event['serial_id']}\nevent: patient\ndata: {json.dumps(event)}\n\n"
+
+patient_feed = PatientFeed()
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+import uuid
+from fastapi.concurrency import run_in_threadpool
+from app.cache import LRUCache, record_cache, patient_key, LAST_PATIENT_KEY
+from app.repository import repository
+from app.similarity import index_patient
+
+# INGEST_MODE=write_behind acknowledges POST /patients/ with 202 and inserts in group commits
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+WRITE_BEHIND = INGEST_MODE == "write_behind"
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "0.05"))
+# Tracking IDs remembered for the status endpoint
+INGEST_STATUS_SIZE = int(os.getenv("INGEST_STATUS_SIZE", "100000"))
+
+class QueueFull(Exception):
+    pass
+
+class WriteBehindQueue:
+    """Bounded queue of validated patients, flushed by one background writer.
+
+    A flush happens when INGEST_BATCH_SIZE patients are waiting or
+    INGEST_FLUSH_SECONDS after the first one arrived, whichever comes first,
+    and inserts the whole batch in one multi-row transaction.
+    """
+
+    def __init__(self, maxsize=INGEST_QUEUE_SIZE, batch_size=INGEST_BATCH_SIZE, flush_seconds=INGEST_FLUSH_SECONDS):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = None
+        self._task = None
+        self._statuses = LRUCache(INGEST_STATUS_SIZE)
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.created = 0
+        self.failed = 0
+        self.flush_seconds_total = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the writer."""
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, patient):
+        """Queue a patient and return its tracking ID; QueueFull when the queue is at capacity."""
+        tracking_id = uuid.uuid4().hex
+        try:
+            self._queue.put_nowait((tracking_id, patient))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull()
+        self.accepted += 1
+        self._statuses.put(tracking_id, {"tracking_id": tracking_id, "status": "queued", "id": patient.id})
+        return tracking_id
+
+    def status(self, tracking_id):
+        return self._statuses.get(tracking_id)
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"Write-behind flush error: {e}")
+                for tracking_id, patient in batch:
+                    self._statuses.put(
+                        tracking_id, {"tracking_id": tracking_id, "status": "failed", "id": patient.id, "detail": str(e)}
+                    )
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        # atomic=False: one bad item (e.g. an existing ID) must not fail the others
+        results = await run_in_threadpool(repository.create_patients, [patient for _, patient in batch], False)
+        self.flush_seconds_total += time.perf_counter() - start
+        self.batches += 1
+
+        created = []
+        for (tracking_id, patient), result in zip(batch, results):
+            status = {"tracking_id": tracking_id, "status": result["status"], "id": result["id"]}
+            if "detail" in result:
+                status["detail"] = result["detail"]
+            self._statuses.put(tracking_id, status)
+            if result["status"] == "created":
+                created.append(result["id"])
+                index_patient(result["id"], patient.diagnosis, patient.model_dump())
+        self.created += len(created)
+        self.failed += len(batch) - len(created)
+
+        await record_cache.invalidate(LAST_PATIENT_KEY, *(patient_key(patient_id) for patient_id in created))
+
+    def stats(self):
+        return {
+            "enabled": WRITE_BEHIND,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.maxsize,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "created": self.created,
+            "failed": self.failed,
+            "avg_batch_size": (self.created + self.failed) / self.batches if self.batches else 0.0,
+            "avg_flush_seconds": self.flush_seconds_total / self.batches if self.batches else 0.0,
+        }
+
+write_behind = WriteBehindQueue()
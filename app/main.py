@@ -1,342 +1,721 @@
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional
-import random
-import string
-from app.database import get_connection
-from psycopg2.extras import RealDictCursor
-
-app = FastAPI()
-
-# Pydantic models for request/response validation
-class TumorMean(BaseModel):
-    radius_mean: float
-    texture_mean: float
-    perimeter_mean: float
-    area_mean: float
-    smoothness_mean: float
-    compactness_mean: float
-    concavity_mean: float
-    concave_points_mean: float
-    symmetry_mean: float
-    fractal_dimension_mean: float
-
-class TumorSE(BaseModel):
-    radius_se: float
-    texture_se: float
-    perimeter_se: float
-    area_se: float
-    smoothness_se: float
-    compactness_se: float
-    concavity_se: float
-    concave_points_se: float
-    symmetry_se: float
-    fractal_dimension_se: float
-
-class TumorWorst(BaseModel):
-    radius_worst: float
-    texture_worst: float
-    perimeter_worst: float
-    area_worst: float
-    smoothness_worst: float
-    compactness_worst: float
-    concavity_worst: float
-    concave_points_worst: float
-    symmetry_worst: float
-    fractal_dimension_worst: float
-
-class Patient(BaseModel):
-    id: Optional[str] = None
-    diagnosis: str
-    tumor_mean: TumorMean
-    tumor_se: TumorSE
-    tumor_worst: TumorWorst
-
-# Function that generate a unique 5-6 digit ID
-def generate_unique_id():
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
-
-    while True:
-        # Generate a random 5-6 digit ID
-        patient_id = ''.join(random.choices(string.digits, k=random.randint(5, 6)))
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM patients WHERE id = %s", (patient_id,))
-            if not cursor.fetchone():
-                return patient_id
-
-# Root Endpoint - Get all patients
-@app.get("/")
-def get_all_data():
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
-
-    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from typing import List, Optional
+import asyncio
+import base64
+import csv
+import io
+import os
+import time
+import numpy as np
+from numpy.lib import format as npy_format
+from app.schemas import (
+    Patient, PatientPatch, PatientFeatures,
+    TUMOR_MEAN_COLUMNS, TUMOR_SE_COLUMNS, TUMOR_WORST_COLUMNS
+)
+from app.database import pool_stats
+from app.metrics import MetricsMiddleware, render_metrics
+from app.cache import record_cache, configure_record_cache, patient_key, LAST_PATIENT_KEY
+from app.model import (
+    load_model, get_model, predict_features, prediction_cache, invalidate_predictions,
+    registry, watch_model, ModelLoadError, MODEL_WATCH_SECONDS, SHADOW_MODEL_PATH
+)
+from app import async_database, scoring
+from app.async_database import USE_ASYNC_DB
+from app.feed import patient_feed, format_event, RecentIds, FEED_KEEPALIVE_SECONDS, FEED_BACKFILL_OVERLAP
+from app.ingest import write_behind, WRITE_BEHIND, QueueFull
+from app.similarity import (
+    similarity_index, index_patient, unindex_patient, SIMILARITY_ENABLED, SIMILARITY_BUILD_FETCH_SIZE
+)
+from app.repository import (
+    repository, STORAGE_BACKEND, EXPORT_COLUMNS, FEATURE_MATRIX_COLUMNS, PATIENT_ROW_COLUMNS,
+    nest_patient_row, DatabaseUnavailable, BatchRejected
+)
+from app.serialization import FastJSONResponse, dumps, columnar
+
+# Open the storage backend and load the model on startup, close it on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # An unreachable database must not stop the app from starting: the pools
+    # connect on first use, and /db/pool reports them as not open until then
+    try:
+        repository.open()
+    except Exception as e:
+        print(f"Database Connection Error: {e}")
+    if USE_ASYNC_DB:
         try:
-            # Fetch all patients
-            cursor.execute("SELECT * FROM patients")
-            patients = cursor.fetchall()
-
-            all_data = []
-            for patient in patients:
-                patient_id = patient["id"]
-
-                # Fetch tumor data
-                cursor.execute("SELECT * FROM tumor_mean WHERE id = %s", (patient_id,))
-                tumor_mean = cursor.fetchone()
-
-                cursor.execute("SELECT * FROM tumor_se WHERE id = %s", (patient_id,))
-                tumor_se = cursor.fetchone()
-
-                cursor.execute("SELECT * FROM tumor_worst WHERE id = %s", (patient_id,))
-                tumor_worst = cursor.fetchone()
+            await async_database.init_async_pool()
+        except Exception as e:
+            print(f"Database Connection Error: {e}")
+    configure_record_cache()
+    try:
+        load_model()
+    except Exception as e:
+        print(f"Model Loading Error: {e}")
+    if SHADOW_MODEL_PATH:
+        try:
+            registry.set_shadow(SHADOW_MODEL_PATH)
+        except ModelLoadError as e:
+            print(f"Shadow Model Loading Error: {e}")
+    model_watch_task = asyncio.create_task(watch_model()) if MODEL_WATCH_SECONDS > 0 else None
+    if STORAGE_BACKEND == "postgres":
+        await patient_feed.start()
+    if WRITE_BEHIND:
+        await write_behind.start()
+    # Build the similar-patients index in the background; it serves queries once ready
+    index_task = asyncio.create_task(build_similarity_index()) if SIMILARITY_ENABLED else None
+    yield
+    if index_task is not None:
+        index_task.cancel()
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    # Flush queued writes before the pools close
+    await write_behind.stop()
+    await patient_feed.stop()
+    if USE_ASYNC_DB:
+        await async_database.close_async_pool()
+    repository.close()
+
+async def build_similarity_index():
+    try:
+        await run_in_threadpool(
+            lambda: similarity_index.build(repository.export_chunks(SIMILARITY_BUILD_FETCH_SIZE))
+        )
+    except Exception as e:
+        print(f"Similarity Index Error: {e}")
 
-                patient_data = {
-                    "patient": patient,
-                    "tumor_mean": tumor_mean,
-                    "tumor_se": tumor_se,
-                    "tumor_worst": tumor_worst,
-                }
-                all_data.append(patient_data)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(MetricsMiddleware)
 
-            return all_data
+MAX_PAGE_SIZE = 1000
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+# Bulk export: same column layout as dataset/data.csv, read EXPORT_FETCH_SIZE rows at a time
+EXPORT_FETCH_SIZE = 5000
+EXPORT_HEADER = [c.replace("concave_points", "concave points") for c in EXPORT_COLUMNS]
 
-        finally:
-            conn.close()
+# Map storage errors onto the HTTP errors the endpoints have always returned
+def storage_error(e):
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, DatabaseUnavailable):
+        return HTTPException(status_code=500, detail="Database connection error")
+    return HTTPException(status_code=500, detail=str(e))
 
-# Get the last inserted patient record
-@app.get("/patients/last")
-def get_last_patient():
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
+# Opaque page cursors wrap the last serial_id of the previous page
+def encode_cursor(serial_id):
+    return base64.urlsafe_b64encode(str(serial_id).encode()).decode()
 
+def decode_cursor(cursor):
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            # Get the last inserted patient
-            cursor.execute("SELECT * FROM patients ORDER BY serial_id DESC LIMIT 1")
-            patient = cursor.fetchone()
-
-            if not patient:
-                raise HTTPException(status_code=404, detail="No patients found")
-
-            patient_id = patient["id"]
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+
+# Connection pool usage (in use, idle, wait time) of both pools, for sizing them per worker
+@app.get("/db/pool")
+def get_pool_stats():
+    stats = pool_stats()
+    if USE_ASYNC_DB:
+        stats["async"] = async_database.pool_stats()
+    return stats
+
+# Per-route latency and DB metrics in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    stats = pool_stats()
+    async_stats = async_database.pool_stats()
+    return PlainTextResponse(
+        render_metrics({
+            "db_pool_in_use": stats["in_use"],
+            "db_pool_idle": stats["idle"],
+            "db_pool_max_size": stats["max_size"],
+            "db_pool_wait_seconds_max": stats["max_wait_seconds"],
+            "db_async_pool_in_use": async_stats["in_use"],
+            "db_async_pool_idle": async_stats["idle"],
+            "db_async_pool_max_size": async_stats["max_size"],
+            "patient_feed_subscribers": patient_feed.stats()["subscribers"],
+            "ingest_queue_depth": write_behind.stats()["queued"],
+        }),
+        media_type="text/plain; version=0.0.4",
+    )
+
+# Root Endpoint - Get all patients, one page at a time (keyset pagination on serial_id).
+# format=columnar returns {"columns", "values"} with one array per column instead
+# of one nested object per patient, for clients that load pages into data frames.
+@app.get("/")
+def get_all_data(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: str = Query("nested", pattern="^(nested|columnar)$"),
+):
+    after_serial_id = decode_cursor(after) if after else 0
 
-            # Fetch tumor data
-            cursor.execute("SELECT * FROM tumor_mean WHERE id = %s", (patient_id,))
-            tumor_mean = cursor.fetchone()
+    try:
+        # One joined query per page; fetch one extra row to know if there is a next page
+        rows = repository.list_patient_rows(after_serial_id, limit + 1)
+    except Exception as e:
+        raise storage_error(e)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0])
+
+    # Plain tuples straight to the encoder, skipping jsonable_encoder
+    if format == "columnar":
+        return FastJSONResponse({**columnar(PATIENT_ROW_COLUMNS, rows), "next_cursor": next_cursor})
+    return FastJSONResponse({"data": [nest_patient_row(row) for row in rows], "next_cursor": next_cursor})
+
+# Encode the exported chunks as they are read, holding the storage
+# connection until the client has received the last chunk
+def stream_export(chunks, fmt):
+    if fmt == "ndjson":
+        for rows in chunks:
+            yield b"".join(dumps(dict(zip(EXPORT_COLUMNS, row))) + b"\n" for row in rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Bulk export of the whole dataset as NDJSON or CSV
+@app.get("/export")
+def export_data(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    try:
+        chunks = repository.export_chunks(EXPORT_FETCH_SIZE)
+    except Exception as e:
+        raise storage_error(e)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(chunks, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=patients.{format}"},
+    )
+
+FEATURES_FETCH_SIZE = 10000
+
+# .npy header for a C-ordered little-endian float64 matrix of the given shape
+def npy_header(shape):
+    buffer = io.BytesIO()
+    npy_format.write_array_header_1_0(buffer, {"descr": "<f8", "fortran_order": False, "shape": shape})
+    return buffer.getvalue()
+
+# Convert each chunk of row tuples straight into float64 bytes (NULL features become NaN)
+def stream_npy(header, chunks):
+    yield header
+    for rows in chunks:
+        yield np.array(rows, dtype="<f8").tobytes()
+
+# The patient_features view as one .npy file: float64, shape (patients, 32),
+# columns serial_id, malignant and the 30 model features (listed in X-Columns)
+@app.get("/features")
+def get_feature_matrix():
+    try:
+        count, chunks = repository.feature_matrix(FEATURES_FETCH_SIZE)
+    except Exception as e:
+        raise storage_error(e)
+
+    header = npy_header((count, len(FEATURE_MATRIX_COLUMNS)))
+    return StreamingResponse(
+        stream_npy(header, chunks),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": "attachment; filename=patient_features.npy",
+            "Content-Length": str(len(header) + count * len(FEATURE_MATRIX_COLUMNS) * 8),
+            "X-Columns": ",".join(FEATURE_MATRIX_COLUMNS),
+        },
+    )
+
+# Refresh the patient_features materialized view (after loads or on a schedule)
+@app.post("/features/refresh")
+def refresh_feature_matrix():
+    started = time.perf_counter()
+    try:
+        repository.refresh_features()
+    except Exception as e:
+        raise storage_error(e)
+    return {"message": "Feature matrix refreshed", "seconds": round(time.perf_counter() - started, 3)}
 
-            cursor.execute("SELECT * FROM tumor_se WHERE id = %s", (patient_id,))
-            tumor_se = cursor.fetchone()
+# Per-diagnosis feature means/variances and histograms, read from the summary tables
+# the database triggers keep current (a fixed number of rows however many patients)
+@app.get("/stats")
+def get_stats():
+    try:
+        return repository.get_stats()
+    except Exception as e:
+        raise storage_error(e)
 
-            cursor.execute("SELECT * FROM tumor_worst WHERE id = %s", (patient_id,))
-            tumor_worst = cursor.fetchone()
+# Recompute the summary tables from scratch (backfill, or after loading with triggers disabled)
+@app.post("/stats/rebuild")
+def rebuild_stats():
+    started = time.perf_counter()
+    try:
+        repository.rebuild_stats()
+    except Exception as e:
+        raise storage_error(e)
+    return {"message": "Cohort statistics rebuilt", "seconds": round(time.perf_counter() - started, 3)}
+
+# Record cache counters (hits, misses, coalesced loads) for tuning RECORD_CACHE_TTL/SIZE
+@app.get("/cache/records")
+def get_record_cache_stats():
+    return record_cache.stats()
+
+FEED_BACKFILL_LIMIT = 1000
+
+# Server-Sent Events stream of newly inserted patients, fanned out from one
+# shared LISTEN connection. Reconnecting clients send Last-Event-ID (or
+# ?after=<serial_id>) and first receive the patients they missed, plus the
+# FEED_BACKFILL_OVERLAP window before it again, so events are at-least-once.
+@app.get("/patients/events")
+async def patient_events(request: Request, after: Optional[int] = None):
+    if STORAGE_BACKEND != "postgres":
+        raise HTTPException(status_code=501, detail="The patient feed requires the postgres storage backend")
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    # Subscribe before backfilling so nothing inserted in between is lost
+    subscriber = patient_feed.subscribe()
+    return StreamingResponse(
+        stream_patient_events(request, subscriber, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def stream_patient_events(request, subscriber, after):
+    # Deduplicated by patient ID, not serial_id: a patient can commit (and be
+    # notified) after one with a higher serial_id
+    sent = RecentIds()
+    try:
+        # A patient with a lower serial_id than the client's last event may have
+        # committed after it, so the backfill starts an overlap window earlier
+        cursor = max(after - FEED_BACKFILL_OVERLAP, 0) if after is not None else None
+        while cursor is not None:
+            rows = await run_in_threadpool(repository.list_patients, cursor, FEED_BACKFILL_LIMIT)
+            for row in rows:
+                patient = row["patient"]
+                cursor = patient["serial_id"]
+                sent.add(patient["id"])
+                yield format_event({k: patient[k] for k in ("id", "serial_id", "diagnosis")})
+            if len(rows) < FEED_BACKFILL_LIMIT:
+                break
+
+        # An overflowed subscriber was dropped by the feed; ending the stream
+        # makes the client reconnect and backfill from its last event
+        while not subscriber.overflowed:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), FEED_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if not sent.add(event["id"]):
+                continue
+            yield format_event(event)
+    finally:
+        patient_feed.unsubscribe(subscriber)
+
+# Listener state and subscriber counts of the patient feed
+@app.get("/patients/events/stats")
+def get_patient_feed_stats():
+    return patient_feed.stats()
+
+# Write-behind queue depth, batch sizes and flush times (INGEST_MODE=write_behind)
+@app.get("/patients/ingest")
+def get_ingest_stats():
+    return write_behind.stats()
+
+# Status of a patient accepted by the write-behind queue
+@app.get("/patients/ingest/{tracking_id}")
+def get_ingest_status(tracking_id: str):
+    status = write_behind.status(tracking_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown tracking ID")
+    return status
+
+# Get the last inserted patient record (cached, concurrent pollers share one fetch)
+@app.get("/patients/last")
+async def get_last_patient():
+    return await record_cache.get_or_load(LAST_PATIENT_KEY, load_last_patient)
 
-            return {
-                "patient": patient,
-                "tumor_mean": tumor_mean,
-                "tumor_se": tumor_se,
-                "tumor_worst": tumor_worst,
-            }
+async def load_last_patient():
+    if not USE_ASYNC_DB:
+        return await run_in_threadpool(get_last_patient_sync)
 
+    try:
+        record = await async_database.fetch_last_patient()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        conn.close()
+    if not record:
+        raise HTTPException(status_code=404, detail="No patients found")
+    return record
 
-# Get a patient by ID
-@app.get("/patients/{patient_id}")
-def read_patient(patient_id: str):
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
-
-    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+# Blocking implementation on the storage backend (DB_ASYNC=0 or STORAGE_BACKEND=sqlite)
+def get_last_patient_sync():
+    try:
+        record = repository.get_last_patient()
+    except Exception as e:
+        raise storage_error(e)
+
+    if not record:
+        raise HTTPException(status_code=404, detail="No patients found")
+    return record
+
+# Predict the diagnosis of a stored patient with the in-memory model
+@app.get("/patients/{patient_id}/predict")
+def predict_patient(patient_id: str):
+    # Pin the active model so the cached result is stored under the version that produced it
+    active = registry.active
+    if active is None:
+        raise HTTPException(status_code=503, detail="Model is not loaded")
+
+    cache_key = (patient_id, active.version)
+    cached = prediction_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Not cached if the patient is updated while its features are read and scored
+    with prediction_cache.loading(patient_id) as store:
         try:
-            # Fetch patient
-            cursor.execute("SELECT * FROM patients WHERE id = %s", (patient_id,))
-            patient = cursor.fetchone()
-
-            if not patient:
-                raise HTTPException(status_code=404, detail="Patient not found")
+            features = repository.get_features(patient_id)
+        except Exception as e:
+            raise storage_error(e)
+
+        if not features:
+            raise HTTPException(status_code=404, detail="Patient not found")
+
+        result = {"id": patient_id, **predict_features(features, active)}
+        store(cache_key, result)
+    return result
+
+# Prediction cache hit/miss counters for tuning PREDICTION_CACHE_SIZE
+@app.get("/predictions/cache")
+def get_prediction_cache_stats():
+    return prediction_cache.stats()
+
+# Predict a diagnosis from raw tumor features
+@app.post("/predict")
+def predict(payload: PatientFeatures):
+    if get_model() is None:
+        raise HTTPException(status_code=503, detail="Model is not loaded")
+
+    features = (
+        [getattr(payload.tumor_mean, c) for c in TUMOR_MEAN_COLUMNS]
+        + [getattr(payload.tumor_se, c) for c in TUMOR_SE_COLUMNS]
+        + [getattr(payload.tumor_worst, c) for c in TUMOR_WORST_COLUMNS]
+    )
+    return predict_features(features)
+
+# Active model, rollback history, shadow comparison and the artifacts available
+@app.get("/models")
+def get_models():
+    try:
+        artifacts = registry.artifacts()
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**registry.stats(), "artifacts": artifacts}
 
-            # Fetch tumor data
-            cursor.execute("SELECT * FROM tumor_mean WHERE id = %s", (patient_id,))
-            tumor_mean = cursor.fetchone()
+def resolve_artifact(artifact, version):
+    if (artifact is None) == (version is None):
+        raise HTTPException(status_code=422, detail="Pass exactly one of artifact or version")
+    try:
+        return registry.resolve(artifact, version)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Model artifact not found")
+
+# Load and warm up an artifact from the registry, then switch to it. Requests keep
+# being served by the current model until the switch.
+@app.post("/models/activate")
+def activate_model(artifact: Optional[str] = None, version: Optional[str] = None):
+    path = resolve_artifact(artifact, version)
+    try:
+        loaded = registry.activate(path)
+    except ModelLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Model activated", "active": loaded.describe()}
+
+# Switch back to the previously active model
+@app.post("/models/rollback")
+def rollback_model():
+    loaded = registry.rollback()
+    if loaded is None:
+        raise HTTPException(status_code=409, detail="No previous model to roll back to")
+    return {"message": "Model rolled back", "active": loaded.describe()}
+
+# Score every prediction request with this candidate too, in the background,
+# and report latency and disagreement on GET /models
+@app.post("/models/shadow")
+def set_shadow_model(artifact: Optional[str] = None, version: Optional[str] = None):
+    path = resolve_artifact(artifact, version)
+    try:
+        loaded = registry.set_shadow(path)
+    except ModelLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Shadow model set", "shadow": loaded.describe()}
+
+@app.delete("/models/shadow")
+def clear_shadow_model():
+    registry.clear_shadow()
+    return {"message": "Shadow model cleared"}
+
+# Score every patient in the background and store the results in predictions
+@app.post("/predictions/run", status_code=202)
+def run_batch_scoring(
+    background_tasks: BackgroundTasks,
+    chunk_size: int = Query(10000, ge=100, le=100000),
+    workers: int = Query(1, ge=1, le=os.cpu_count() or 1),
+):
+    if STORAGE_BACKEND != "postgres":
+        raise HTTPException(status_code=501, detail="Batch scoring requires the postgres storage backend")
+    if get_model() is None:
+        raise HTTPException(status_code=503, detail="Model is not loaded")
+    if not scoring.start_job():
+        raise HTTPException(status_code=409, detail="Batch scoring is already running")
+
+    background_tasks.add_task(scoring.run_job, chunk_size, workers)
+    return {"message": "Batch scoring started"}
+
+# Status of the last batch scoring run
+@app.get("/predictions/run")
+def get_batch_scoring_status():
+    return scoring.job_status()
+
+MAX_SIMILAR = 100
+
+# The k most similar other patients by Euclidean distance over the standardized 30 features
+@app.get("/patients/{patient_id}/similar")
+def get_similar_patients(patient_id: str, k: int = Query(10, ge=1, le=MAX_SIMILAR)):
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=501, detail="The similarity index is disabled")
+    if not similarity_index.ready():
+        raise HTTPException(status_code=503, detail="The similarity index is still building", headers={"Retry-After": "5"})
+
+    results = similarity_index.similar(patient_id, k)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"id": patient_id, "k": k, "results": results}
+
+# Size and build state of the similarity index
+@app.get("/similarity")
+def get_similarity_stats():
+    return similarity_index.stats()
+
+# Rebuild the similarity index (also refreshes the standardization)
+@app.post("/similarity/rebuild", status_code=202)
+async def rebuild_similarity_index(background_tasks: BackgroundTasks):
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=501, detail="The similarity index is disabled")
+    if similarity_index.stats()["building"]:
+        raise HTTPException(status_code=409, detail="The similarity index is already building")
+    background_tasks.add_task(build_similarity_index)
+    return {"message": "Similarity index rebuild started"}
+
+# Get a patient by ID (cached, concurrent requests for one patient share one fetch)
+@app.get("/patients/{patient_id}")
+async def read_patient(patient_id: str):
+    return await record_cache.get_or_load(patient_key(patient_id), lambda: load_patient(patient_id))
 
-            cursor.execute("SELECT * FROM tumor_se WHERE id = %s", (patient_id,))
-            tumor_se = cursor.fetchone()
+async def load_patient(patient_id: str):
+    if not USE_ASYNC_DB:
+        return await run_in_threadpool(read_patient_sync, patient_id)
 
-            cursor.execute("SELECT * FROM tumor_worst WHERE id = %s", (patient_id,))
-            tumor_worst = cursor.fetchone()
+    try:
+        record = await async_database.fetch_patient(patient_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            return {
-                "patient": patient,
-                "tumor_mean": tumor_mean,
-                "tumor_se": tumor_se,
-                "tumor_worst": tumor_worst,
-            }
+    if not record:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return record
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+# Blocking implementation on the storage backend (DB_ASYNC=0 or STORAGE_BACKEND=sqlite)
+def read_patient_sync(patient_id: str):
+    try:
+        record = repository.get_patient(patient_id)
+    except Exception as e:
+        raise storage_error(e)
 
-        finally:
-            conn.close()
+    if not record:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return record
 
 # Create a new patient
 @app.post("/patients/")
-def create_patient(patient: Patient):
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
+async def create_patient(patient: Patient):
+    if WRITE_BEHIND:
+        return enqueue_patient(patient)
 
-    with conn.cursor() as cursor:
+    if not USE_ASYNC_DB:
+        result = await run_in_threadpool(create_patient_sync, patient)
+    else:
         try:
-            # Generate a unique ID if not provided
-            if not patient.id:
-                patient.id = generate_unique_id()
-
-            # Insert patient
-            cursor.execute(
-                "INSERT INTO patients (id, diagnosis) VALUES (%s, %s)",
-                (patient.id, patient.diagnosis)
-            )
-
-            # Insert tumor data
-            cursor.execute(
-                """
-                INSERT INTO tumor_mean (
-                    id, radius_mean, texture_mean, perimeter_mean, area_mean, 
-                    smoothness_mean, compactness_mean, concavity_mean, concave_points_mean, 
-                    symmetry_mean, fractal_dimension_mean
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (patient.id, *patient.tumor_mean.dict().values())
-            )
-
-            cursor.execute(
-                """
-                INSERT INTO tumor_se (
-                    id, radius_se, texture_se, perimeter_se, area_se, 
-                    smoothness_se, compactness_se, concavity_se, concave_points_se, 
-                    symmetry_se, fractal_dimension_se
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (patient.id, *patient.tumor_se.dict().values())
-            )
-
-            cursor.execute(
-                """
-                INSERT INTO tumor_worst (
-                    id, radius_worst, texture_worst, perimeter_worst, area_worst, 
-                    smoothness_worst, compactness_worst, concavity_worst, concave_points_worst, 
-                    symmetry_worst, fractal_dimension_worst
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (patient.id, *patient.tumor_worst.dict().values())
-            )
-
-            conn.commit()
-            return {"message": "Patient created successfully", "id": patient.id}
-
+            patient_id = await async_database.insert_patient(patient)
         except Exception as e:
-            conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
+        result = {"message": "Patient created successfully", "id": patient_id}
 
-        finally:
-            conn.close()
+    await record_cache.invalidate(patient_key(result["id"]), LAST_PATIENT_KEY)
+    index_patient(result["id"], patient.diagnosis, patient.model_dump())
+    return result
 
-# Update a patient's details
-@app.put("/patients/{patient_id}")
-def update_patient(patient_id: str, patient: Patient):
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
+# Acknowledge with 202 and leave the insert to the write-behind queue's next group commit
+def enqueue_patient(patient: Patient):
+    try:
+        tracking_id = write_behind.submit(patient)
+    except QueueFull:
+        # Backpressure: the writer is behind, so clients must slow down
+        raise HTTPException(status_code=503, detail="Ingest queue is full", headers={"Retry-After": "1"})
+    return JSONResponse(
+        status_code=202,
+        content={
+            "message": "Patient queued",
+            "tracking_id": tracking_id,
+            "status_url": f"/patients/ingest/{tracking_id}",
+        },
+    )
+
+# Blocking implementation on the storage backend (DB_ASYNC=0 or STORAGE_BACKEND=sqlite)
+def create_patient_sync(patient: Patient):
+    try:
+        patient_id = repository.create_patient(patient)
+    except Exception as e:
+        raise storage_error(e)
+    return {"message": "Patient created successfully", "id": patient_id}
+
+MAX_BATCH_SIZE = 1000
+
+# Create many patients in one transaction with multi-row inserts.
+# atomic=true rolls the whole batch back if any item fails; atomic=false
+# inserts every valid item and reports the rest as failed.
+@app.post("/patients/batch")
+async def create_patients_batch(patients: List[Patient], atomic: bool = True):
+    result = await run_in_threadpool(create_patients_batch_sync, patients, atomic)
+    created = [r for r in result["results"] if r["status"] == "created"]
+    await record_cache.invalidate(LAST_PATIENT_KEY, *(patient_key(r["id"]) for r in created))
+    for r in created:
+        index_patient(r["id"], patients[r["index"]].diagnosis, patients[r["index"]].model_dump())
+    return result
+
+def create_patients_batch_sync(patients: List[Patient], atomic: bool = True):
+    if not patients:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(patients) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch is larger than {MAX_BATCH_SIZE} patients")
 
-    with conn.cursor() as cursor:
-        try:
-            # Update patient
-            cursor.execute(
-                "UPDATE patients SET diagnosis = %s WHERE id = %s",
-                (patient.diagnosis, patient_id)
-            )
-
-            # Update tumor data
-            cursor.execute(
-                """
-                UPDATE tumor_mean SET 
-                    radius_mean = %s, texture_mean = %s, perimeter_mean = %s, area_mean = %s, 
-                    smoothness_mean = %s, compactness_mean = %s, concavity_mean = %s, 
-                    concave_points_mean = %s, symmetry_mean = %s, fractal_dimension_mean = %s 
-                WHERE id = %s
-                """,
-                (*patient.tumor_mean.dict().values(), patient_id)
-            )
-
-            cursor.execute(
-                """
-                UPDATE tumor_se SET 
-                    radius_se = %s, texture_se = %s, perimeter_se = %s, area_se = %s, 
-                    smoothness_se = %s, compactness_se = %s, concavity_se = %s, 
-                    concave_points_se = %s, symmetry_se = %s, fractal_dimension_se = %s 
-                WHERE id = %s
-                """,
-                (*patient.tumor_se.dict().values(), patient_id)
-            )
-
-            cursor.execute(
-                """
-                UPDATE tumor_worst SET 
-                    radius_worst = %s, texture_worst = %s, perimeter_worst = %s, area_worst = %s, 
-                    smoothness_worst = %s, compactness_worst = %s, concavity_worst = %s, 
-                    concave_points_worst = %s, symmetry_worst = %s, fractal_dimension_worst = %s 
-                WHERE id = %s
-                """,
-                (*patient.tumor_worst.dict().values(), patient_id)
-            )
-
-            conn.commit()
-            return {"message": "Patient updated successfully"}
+    try:
+        results = repository.create_patients(patients, atomic)
+    except BatchRejected as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "results": e.results},
+        )
+    except Exception as e:
+        raise storage_error(e)
 
-        except Exception as e:
-            conn.rollback()
-            raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "created": sum(r["status"] == "created" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "results": results,
+    }
 
-        finally:
-            conn.close()
+# Update a patient's details
+@app.put("/patients/{patient_id}")
+async def update_patient(patient_id: str, patient: Patient):
+    return await apply_patient_changes(patient_id, patient.model_dump(exclude={"id"}), complete=True)
 
-# Delete a patient by ID
-@app.delete("/patients/{patient_id}")
-def delete_patient(patient_id: str):
-    conn = get_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection error")
+# Update only the supplied fields of a patient
+@app.patch("/patients/{patient_id}")
+async def patch_patient(patient_id: str, patch: PatientPatch):
+    return await apply_patient_changes(patient_id, patch.model_dump(exclude_unset=True, exclude_none=True))
+
+async def apply_patient_changes(patient_id: str, changes: dict, complete: bool = False):
+    try:
+        if not USE_ASYNC_DB:
+            result = await run_in_threadpool(update_patient_sync, patient_id, changes)
+        else:
+            try:
+                found = await async_database.update_patient(patient_id, changes)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+            invalidate_predictions(patient_id)
+            if not found:
+                raise HTTPException(status_code=404, detail="Patient not found")
+            result = {"message": "Patient updated successfully"}
+    finally:
+        await record_cache.invalidate(patient_key(patient_id), LAST_PATIENT_KEY)
 
-    with conn.cursor() as cursor:
+    # A full update carries every feature; a partial one re-reads the stored record
+    if complete:
+        index_patient(patient_id, changes["diagnosis"], changes)
+    elif SIMILARITY_ENABLED:
         try:
-            # Delete tumor data
-            cursor.execute("DELETE FROM tumor_mean WHERE id = %s", (patient_id,))
-            cursor.execute("DELETE FROM tumor_se WHERE id = %s", (patient_id,))
-            cursor.execute("DELETE FROM tumor_worst WHERE id = %s", (patient_id,))
+            record = await load_patient(patient_id)
+        except HTTPException:
+            # Deleted in the meantime; the delete removes it from the index
+            return result
+        index_patient(patient_id, record["patient"]["diagnosis"], record)
+    return result
+
+# Blocking implementation on the storage backend (DB_ASYNC=0 or STORAGE_BACKEND=sqlite)
+def update_patient_sync(patient_id: str, changes: dict):
+    try:
+        found = repository.update_patient(patient_id, changes)
+    except Exception as e:
+        raise storage_error(e)
 
-            # Delete patient
-            cursor.execute("DELETE FROM patients WHERE id = %s", (patient_id,))
+    invalidate_predictions(patient_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"message": "Patient updated successfully"}
 
-            conn.commit()
-            if cursor.rowcount == 0:
+# Delete a patient by ID
+@app.delete("/patients/{patient_id}")
+async def delete_patient(patient_id: str):
+    try:
+        if not USE_ASYNC_DB:
+            result = await run_in_threadpool(delete_patient_sync, patient_id)
+        else:
+            try:
+                deleted = await async_database.delete_patient(patient_id)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+            invalidate_predictions(patient_id)
+            if not deleted:
                 raise HTTPException(status_code=404, detail="Patient not found")
+            result = {"message": "Patient deleted successfully"}
+    finally:
+        await record_cache.invalidate(patient_key(patient_id), LAST_PATIENT_KEY)
 
-            return {"message": "Patient deleted successfully"}
+    unindex_patient(patient_id)
+    return result
 
-        except Exception as e:
-            conn.rollback()
-            raise HTTPException(status_code=500, detail=str(e))
+# Blocking implementation on the storage backend (DB_ASYNC=0 or STORAGE_BACKEND=sqlite)
+def delete_patient_sync(patient_id: str):
+    try:
+        deleted = repository.delete_patient(patient_id)
+    except Exception as e:
+        raise storage_error(e)
 
-        finally:
-            conn.close()
+    invalidate_predictions(patient_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"message": "Patient deleted successfully"}
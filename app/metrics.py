@@ -0,0 +1,163 @@
+import contextvars
+import os
+import threading
+import time
+
+# Log requests slower than this many seconds together with their queries (disabled when unset)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0")) or None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+
+# Per-request counters, shared with threadpool workers and gathered tasks through the context
+_current = contextvars.ContextVar("request_stats", default=None)
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "acquire_seconds", "queries")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.queries = [] if SLOW_REQUEST_SECONDS else None
+
+def record_query(query, elapsed):
+    """Count one SQL statement against the current request (no-op outside a request)."""
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    if stats.queries is not None:
+        if isinstance(query, bytes):
+            query = query.decode(errors="replace")
+        stats.queries.append((" ".join(str(query).split())[:200], elapsed))
+
+def record_acquire(elapsed):
+    """Add connection pool checkout time to the current request."""
+    stats = _current.get()
+    if stats is not None:
+        stats.acquire_seconds += elapsed
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+class _RouteMetrics:
+    __slots__ = ("latency", "statements", "db_seconds", "acquire_seconds", "errors")
+
+    def __init__(self):
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.statements = _Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.errors = 0
+
+_lock = threading.Lock()
+_routes = {}
+
+def _observe(method, route, status, elapsed, stats):
+    with _lock:
+        metrics = _routes.get((method, route))
+        if metrics is None:
+            metrics = _routes[(method, route)] = _RouteMetrics()
+        metrics.latency.observe(elapsed)
+        metrics.statements.observe(stats.statements)
+        metrics.db_seconds += stats.db_seconds
+        metrics.acquire_seconds += stats.acquire_seconds
+        if status >= 500:
+            metrics.errors += 1
+
+    if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+        print(f"Slow request: {method} {route} took {elapsed:.3f}s "
+              f"({stats.statements} statements, {stats.db_seconds:.3f}s in DB, "
+              f"{stats.acquire_seconds:.3f}s acquiring connections)")
+        for query, query_elapsed in stats.queries:
+            print(f"    {query_elapsed * 1000:8.2f} ms  {query}")
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request until its last body chunk is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = scope.get("route")
+            _observe(scope["method"], route.path if route is not None else "unmatched", status, elapsed, stats)
+
+def _labels(method, route, **extra):
+    pairs = {"method": method, "route": route, **extra}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs.items()) + "}"
+
+def _render_histogram(lines, name, method, route, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(method, route, le=bound)} {cumulative}")
+    lines.append(f'{name}_bucket{_labels(method, route, le="+Inf")} {histogram.count}')
+    lines.append(f"{name}_sum{_labels(method, route)} {histogram.total}")
+    lines.append(f"{name}_count{_labels(method, route)} {histogram.count}")
+
+def render_metrics(gauges=None):
+    """Prometheus text exposition of the per-route metrics plus any extra gauges."""
+    with _lock:
+        routes = sorted(_routes.items())
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), metrics in routes:
+            _render_histogram(lines, "http_request_duration_seconds", method, route, metrics.latency)
+
+        lines += [
+            "# HELP db_statements_per_request SQL statements executed per request.",
+            "# TYPE db_statements_per_request histogram",
+        ]
+        for (method, route), metrics in routes:
+            _render_histogram(lines, "db_statements_per_request", method, route, metrics.statements)
+
+        for name, help_text, attribute in (
+            ("db_query_seconds_total", "Time spent executing SQL statements.", "db_seconds"),
+            ("db_connection_acquire_seconds_total", "Time spent waiting for a pooled connection.", "acquire_seconds"),
+            ("http_request_errors_total", "Requests answered with a 5xx status.", "errors"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), metrics in routes:
+                lines.append(f"{name}{_labels(method, route)} {getattr(metrics, attribute)}")
+
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
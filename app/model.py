@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from app.cache import PredictionCache
+
+# Directory holding the versioned model artifacts (*.pkl) that can be activated
+MODEL_REGISTRY_DIR = os.getenv(
+    "MODEL_REGISTRY_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_best_model")
+)
+# Path to the saved model (defaults to the artifact shipped in saved_best_model/)
+MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(MODEL_REGISTRY_DIR, "Logistic_regression.pkl"))
+# Poll MODEL_PATH every N seconds and hot-swap when the file is replaced (0 disables)
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "0"))
+# Previously active models kept loaded for an instant rollback
+MODEL_HISTORY_SIZE = int(os.getenv("MODEL_HISTORY_SIZE", "3"))
+# Rows scored by a freshly loaded model before it serves traffic
+MODEL_WARMUP_ROWS = 64
+# Candidate model scored alongside the active one, off the request path
+SHADOW_MODEL_PATH = os.getenv("SHADOW_MODEL_PATH")
+# Shadow scorings waiting at most; beyond that they are dropped rather than queued
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1000"))
+SHADOW_LATENCY_WINDOW = 1000
+
+# Model input order (same as preprocess_data in fetch_predict.py)
+FEATURE_NAMES = [
+    "radius", "texture", "perimeter", "area", "smoothness", "compactness",
+    "concavity", "concave_points", "symmetry", "fractal_dimension"
+]
+FEATURE_COLUMNS = [f"{name}_{kind}" for kind in ("mean", "se", "worst") for name in FEATURE_NAMES]
+
+# Predictions keyed by (patient_id, model version)
+prediction_cache = PredictionCache(int(os.getenv("PREDICTION_CACHE_SIZE", "10000")))
+
+class ModelLoadError(Exception):
+    pass
+
+def malignant_column(model):
+    """Column of predict_proba that holds the malignant (class 1) probability."""
+    return list(model.classes_).index(1)
+
+def artifact_version(artifact):
+    """Short content hash of a pickled model."""
+    return hashlib.sha256(artifact).hexdigest()[:12]
+
+class LoadedModel:
+    """An unpickled, warmed-up model and where it came from."""
+
+    __slots__ = ("model", "version", "path", "malignant_index", "loaded_at", "load_seconds")
+
+    def __init__(self, model, version, path, malignant_index, load_seconds):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.malignant_index = malignant_index
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+
+    def probability(self, features):
+        # Missing features (NULL columns, a missing tumor row) score as 0, like
+        # preprocess_data in fetch_predict.py and the batch scorer
+        x = np.nan_to_num(np.asarray(features, dtype=np.float64).reshape(1, -1), nan=0.0)
+        return float(self.model.predict_proba(x)[0, self.malignant_index])
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+        }
+
+def load_artifact(path):
+    """Unpickle and warm up a model without activating it; ModelLoadError if it cannot serve."""
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as model_file:
+            artifact = model_file.read()
+        model = pickle.loads(artifact)
+        malignant_index = malignant_column(model)
+        # The first predict_proba calls are the slow ones; pay for them before the swap,
+        # which also checks that the model accepts the 30 features
+        for _ in range(2):
+            model.predict_proba(np.zeros((MODEL_WARMUP_ROWS, len(FEATURE_COLUMNS))))
+    except Exception as e:
+        raise ModelLoadError(f"{path}: {e}") from e
+    return LoadedModel(model, artifact_version(artifact), path, malignant_index,
+                       round(time.perf_counter() - started, 3))
+
+class ShadowStats:
+    """Latency and disagreement of the shadow model against the active one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.scored = 0
+            self.dropped = 0
+            self.errors = 0
+            self.disagreements = 0
+            self.probability_diff_total = 0.0
+            self.active_latencies = deque(maxlen=SHADOW_LATENCY_WINDOW)
+            self.shadow_latencies = deque(maxlen=SHADOW_LATENCY_WINDOW)
+
+    def record(self, active_probability, shadow_probability, active_seconds, shadow_seconds):
+        with self._lock:
+            self.scored += 1
+            if (active_probability > 0.5) != (shadow_probability > 0.5):
+                self.disagreements += 1
+            self.probability_diff_total += abs(active_probability - shadow_probability)
+            self.active_latencies.append(active_seconds)
+            self.shadow_latencies.append(shadow_seconds)
+
+    def record_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self):
+        def percentiles(latencies):
+            if not latencies:
+                return {"p50_ms": None, "p99_ms": None}
+            p50, p99 = np.percentile(np.fromiter(latencies, dtype=np.float64), [50, 99]) * 1000
+            return {"p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3)}
+
+        with self._lock:
+            return {
+                "scored": self.scored,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "disagreements": self.disagreements,
+                "disagreement_rate": self.disagreements / self.scored if self.scored else 0.0,
+                "mean_probability_diff": self.probability_diff_total / self.scored if self.scored else 0.0,
+                "active_latency": percentiles(self.active_latencies),
+                "shadow_latency": percentiles(self.shadow_latencies),
+            }
+
+class ModelRegistry:
+    """The active model plus rollback history and an optional shadow candidate.
+
+    Models are loaded and warmed up outside the lock; activating one is a single
+    reference assignment, so a request either sees the old model or the new one
+    and never waits for a load.
+    """
+
+    def __init__(self, directory=MODEL_REGISTRY_DIR, history_size=MODEL_HISTORY_SIZE):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active = None
+        self._history = deque(maxlen=history_size)
+        self._shadow = None
+        self._shadow_pending = 0
+        self._shadow_executor = None
+        self.shadow_stats = ShadowStats()
+
+    @property
+    def active(self):
+        return self._active
+
+    def artifact_path(self, artifact):
+        """Path of an artifact file in the registry directory (no other locations are loaded)."""
+        if os.path.basename(artifact) != artifact or not artifact.endswith(".pkl"):
+            raise FileNotFoundError(artifact)
+        path = os.path.join(self.directory, artifact)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(artifact)
+        return path
+
+    def artifacts(self):
+        """The *.pkl files in the registry directory with their content versions."""
+        listing = []
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".pkl") or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                version = artifact_version(f.read())
+            listing.append({"artifact": name, "version": version, "size": os.path.getsize(path),
+                            "modified": os.path.getmtime(path)})
+        return listing
+
+    def resolve(self, artifact=None, version=None):
+        """Path of an artifact given its file name or its version."""
+        if artifact is not None:
+            return self.artifact_path(artifact)
+        for entry in self.artifacts():
+            if entry["version"] == version:
+                return os.path.join(self.directory, entry["artifact"])
+        raise FileNotFoundError(version)
+
+    def _swap(self, loaded):
+        with self._lock:
+            previous = self._active
+            if previous is not None and previous.version != loaded.version:
+                self._history.append(previous)
+            self._active = loaded
+        # Cached predictions belong to the previous artifact
+        prediction_cache.clear()
+        return previous
+
+    def activate(self, path):
+        """Load, warm up and switch to the model at `path`; returns the LoadedModel."""
+        loaded = load_artifact(path)
+        self._swap(loaded)
+        print(f"Model {loaded.version} active ({path}, loaded in {loaded.load_seconds}s)")
+        return loaded
+
+    def rollback(self):
+        """Switch back to the previously active model (still in memory); None if there is none."""
+        with self._lock:
+            if not self._history:
+                return None
+            loaded = self._history.pop()
+            self._active = loaded
+        prediction_cache.clear()
+        print(f"Model rolled back to {loaded.version}")
+        return loaded
+
+    def set_shadow(self, path):
+        loaded = load_artifact(path)
+        with self._lock:
+            if self._shadow_executor is None:
+                self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-model")
+            self._shadow = loaded
+        self.shadow_stats.reset()
+        return loaded
+
+    def clear_shadow(self):
+        with self._lock:
+            self._shadow = None
+
+    def shadow(self, features, active_probability, active_seconds):
+        """Score `features` with the shadow model in the background, if one is set."""
+        shadow = self._shadow
+        if shadow is None:
+            return
+        with self._lock:
+            if self._shadow_pending >= SHADOW_QUEUE_SIZE:
+                self.shadow_stats.record_dropped()
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._score_shadow, shadow, features, active_probability, active_seconds)
+
+    def _score_shadow(self, shadow, features, active_probability, active_seconds):
+        try:
+            started = time.perf_counter()
+            probability = shadow.probability(features)
+            self.shadow_stats.record(active_probability, probability, active_seconds, time.perf_counter() - started)
+        except Exception as e:
+            print(f"Shadow model error: {e}")
+            self.shadow_stats.record_error()
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def stats(self):
+        with self._lock:
+            active, shadow, history = self._active, self._shadow, list(self._history)
+            pending = self._shadow_pending
+        return {
+            "active": active.describe() if active else None,
+            "history": [loaded.describe() for loaded in reversed(history)],
+            "shadow": {**shadow.describe(), "pending": pending, **self.shadow_stats.stats()} if shadow else None,
+            "watch_seconds": MODEL_WATCH_SECONDS,
+        }
+
+registry = ModelRegistry()
+
+def load_model(path=MODEL_PATH):
+    """Load a model and make it the active one; returns the unpickled model."""
+    return registry.activate(path).model
+
+def get_model():
+    active = registry.active
+    return active.model if active else None
+
+def model_path():
+    active = registry.active
+    return active.path if active else None
+
+def model_version():
+    """Short content hash of the active artifact."""
+    active = registry.active
+    return active.version if active else None
+
+def invalidate_predictions(patient_id):
+    """Drop the cached predictions (every model version) of a patient whose data changed."""
+    prediction_cache.invalidate(patient_id)
+
+def predict_features(features, active=None):
+    """Score one 30-feature vector in preprocess_data order with `active` (default: the active model)."""
+    active = active or registry.active
+    started = time.perf_counter()
+    probability = active.probability(features)
+    registry.shadow(features, probability, time.perf_counter() - started)
+    return {
+        "prediction": "Malignant" if probability > 0.5 else "Benign",
+        "probability_malignant": probability,
+    }
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+async def watch_model(path=MODEL_PATH, interval=MODEL_WATCH_SECONDS):
+    """Hot-swap the model whenever the file at `path` is replaced."""
+    signature = _file_signature(path)
+    while True:
+        await asyncio.sleep(interval)
+        current = _file_signature(path)
+        if current is None or current == signature:
+            continue
+        # Let a copy in progress finish before reading the file
+        await asyncio.sleep(interval)
+        if _file_signature(path) != current:
+            continue
+        signature = current
+        try:
+            await run_in_threadpool(registry.activate, path)
+        except ModelLoadError as e:
+            print(f"Model Loading Error: {e}")
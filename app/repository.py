@@ -0,0 +1,801 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from app.database import get_connection, release_connection, init_pool, close_pool, TupleCursor, DictCursor
+from app.metrics import record_query
+from app.schemas import PATIENT_COLUMNS, TUMOR_MEAN_COLUMNS, TUMOR_SE_COLUMNS, TUMOR_WORST_COLUMNS
+
+# Storage engine behind the patient endpoints: "postgres" or "sqlite" (embedded, no server needed)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+SQLITE_PATH = os.getenv("SQLITE_PATH", ":memory:")
+
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "databases", "sqlSchema.sql"
+)
+
+def read_schema(path=SCHEMA_PATH):
+    """The SQL of a schema script with its psql \\ir includes expanded, for clients other than psql."""
+    directory = os.path.dirname(path)
+    with open(path) as f:
+        return re.sub(
+            r"^\\ir\s+(\S+)\s*$", lambda include: read_schema(os.path.join(directory, include.group(1))),
+            f.read(), flags=re.M,
+        )
+
+TUMOR_TABLES = {
+    "tumor_mean": TUMOR_MEAN_COLUMNS,
+    "tumor_se": TUMOR_SE_COLUMNS,
+    "tumor_worst": TUMOR_WORST_COLUMNS,
+}
+FEATURE_COLUMNS = TUMOR_MEAN_COLUMNS + TUMOR_SE_COLUMNS + TUMOR_WORST_COLUMNS
+EXPORT_COLUMNS = ["id", "diagnosis"] + FEATURE_COLUMNS
+
+# m./s./w. feature columns in preprocess_data order, shared by the joined selects
+FEATURE_FIELDS = ", ".join(
+    [f"m.{c}" for c in TUMOR_MEAN_COLUMNS]
+    + [f"s.{c}" for c in TUMOR_SE_COLUMNS]
+    + [f"w.{c}" for c in TUMOR_WORST_COLUMNS]
+)
+
+# Patients joined with their three tumor tables in a single query, one plain
+# tuple per patient in PATIENT_ROW_COLUMNS order
+PATIENT_ROW_COLUMNS = PATIENT_COLUMNS + FEATURE_COLUMNS
+PATIENT_SELECT = f"""
+    SELECT {", ".join("p." + c for c in PATIENT_COLUMNS)}, {FEATURE_FIELDS}
+    FROM patients p
+    LEFT JOIN tumor_mean m ON m.patient_id = p.id
+    LEFT JOIN tumor_se s ON s.patient_id = p.id
+    LEFT JOIN tumor_worst w ON w.patient_id = p.id
+"""
+
+# The 30 model features of one patient; a missing tumor row comes back as NULLs
+FEATURE_SELECT = f"""
+    SELECT {FEATURE_FIELDS}
+    FROM patients p
+    LEFT JOIN tumor_mean m ON m.patient_id = p.id
+    LEFT JOIN tumor_se s ON s.patient_id = p.id
+    LEFT JOIN tumor_worst w ON w.patient_id = p.id
+    WHERE p.id = %s
+"""
+
+# Same column layout as dataset/data.csv
+EXPORT_FROM = """
+    FROM patients p
+    JOIN tumor_mean m ON m.patient_id = p.id
+    JOIN tumor_se s ON s.patient_id = p.id
+    JOIN tumor_worst w ON w.patient_id = p.id
+"""
+EXPORT_SELECT = f"SELECT p.id, p.diagnosis, {FEATURE_FIELDS} {EXPORT_FROM}"
+
+# Rows of the patient_features view as the float matrix /features serves
+FEATURE_MATRIX_COLUMNS = ["serial_id", "malignant"] + FEATURE_COLUMNS
+FEATURE_MATRIX_SELECT = f"SELECT {', '.join(FEATURE_MATRIX_COLUMNS)} FROM patient_features ORDER BY serial_id"
+
+# Insert a patient and its three tumor rows in a single round trip
+CREATE_PATIENT = f"""
+    WITH new_patient AS (
+        INSERT INTO patients (id, diagnosis)
+        VALUES (COALESCE(%s, next_patient_id()), %s)
+        RETURNING id
+    ),
+    new_mean AS (
+        INSERT INTO tumor_mean (patient_id, {", ".join(TUMOR_MEAN_COLUMNS)})
+        SELECT id, {", ".join(["%s"] * len(TUMOR_MEAN_COLUMNS))} FROM new_patient
+    ),
+    new_se AS (
+        INSERT INTO tumor_se (patient_id, {", ".join(TUMOR_SE_COLUMNS)})
+        SELECT id, {", ".join(["%s"] * len(TUMOR_SE_COLUMNS))} FROM new_patient
+    ),
+    new_worst AS (
+        INSERT INTO tumor_worst (patient_id, {", ".join(TUMOR_WORST_COLUMNS)})
+        SELECT id, {", ".join(["%s"] * len(TUMOR_WORST_COLUMNS))} FROM new_patient
+    )
+    SELECT id FROM new_patient
+"""
+
+# Delete a patient in one statement; ON DELETE CASCADE removes its tumor rows
+# through the tumor_*_patient_id_idx indexes
+DELETE_PATIENT = "DELETE FROM patients WHERE id = %s RETURNING id"
+
+# Cohort statistics kept current by the triggers on the patient and tumor tables
+STATS_SELECT = "SELECT diagnosis, feature, n, total, total_sq FROM feature_stats WHERE n > 0"
+HISTOGRAM_SELECT = """
+    SELECT h.diagnosis, h.feature, h.bucket, h.count, b.low, b.high, b.buckets
+    FROM feature_histograms h
+    JOIN histogram_bins b ON b.feature = h.feature
+    WHERE h.count > 0
+"""
+
+def summarize_stats(stat_rows, histogram_rows):
+    """Per-diagnosis mean/variance and histograms from the summary-table rows.
+
+    `stat_rows` are (diagnosis, feature, n, total, total_sq) and `histogram_rows`
+    (diagnosis, feature, bucket, count, low, high, buckets), as in STATS_SELECT
+    and HISTOGRAM_SELECT.
+    """
+    order = {c: i for i, c in enumerate(FEATURE_COLUMNS)}
+    diagnoses = {}
+    for diagnosis, feature, n, total, total_sq in sorted(stat_rows, key=lambda r: (r[0], order.get(r[1], len(order)))):
+        mean = total / n
+        # Sample variance from the running sums; rounding can leave a tiny negative
+        variance = max(total_sq - total * total / n, 0.0) / (n - 1) if n > 1 else 0.0
+        features = diagnoses.setdefault(diagnosis, {"features": {}, "histograms": {}})["features"]
+        features[feature] = {"count": n, "mean": mean, "variance": variance, "std": variance ** 0.5}
+
+    for diagnosis, feature, bucket, count, low, high, buckets in histogram_rows:
+        histograms = diagnoses.setdefault(diagnosis, {"features": {}, "histograms": {}})["histograms"]
+        # counts[0] is below `low`, counts[-1] at or above `high`
+        histogram = histograms.setdefault(
+            feature, {"low": low, "high": high, "width": (high - low) / buckets, "counts": [0] * (buckets + 2)}
+        )
+        histogram["counts"][bucket] = count
+    return {"diagnoses": diagnoses}
+
+def key_column(table):
+    """Column holding the patient ID: patients.id, tumor_*.patient_id."""
+    return "id" if table == "patients" else "patient_id"
+
+def changed_columns(changes):
+    """(table, {column: value}) pairs for the fields present in an update.
+
+    `changes` is shaped like the request body: {"diagnosis": ..., "tumor_mean":
+    {column: value}, ...}; missing or None fields are left untouched.
+    """
+    tables = []
+    if changes.get("diagnosis") is not None:
+        tables.append(("patients", {"diagnosis": changes["diagnosis"]}))
+    for table, columns in TUMOR_TABLES.items():
+        values = {c: v for c, v in (changes.get(table) or {}).items() if c in columns and v is not None}
+        if values:
+            tables.append((table, values))
+    return tables
+
+def update_patient_query(patient_id, changes, placeholder=lambda position: "%s"):
+    """One statement applying `changes` to a patient, returning (query, params).
+
+    Rows whose values would not change are not rewritten, so an unchanged
+    diagnosis never reaches the log_diagnosis_change trigger. The query yields
+    one row with `found`, false when the patient does not exist.
+    """
+    values = [("id", "varchar", patient_id)]
+    for table, columns in changed_columns(changes):
+        values += [(c, "varchar" if table == "patients" else "float8", v) for c, v in columns.items()]
+    change_row = ", ".join(
+        f"{placeholder(i)}::{type_} AS {name}" for i, (name, type_, _) in enumerate(values, start=1)
+    )
+
+    ctes = [f"changes AS (SELECT {change_row})"]
+    for table, columns in changed_columns(changes):
+        ctes.append(f"""update_{table} AS (
+            UPDATE {table} t SET {", ".join(f"{c} = c.{c}" for c in columns)}
+            FROM changes c
+            WHERE t.{key_column(table)} = c.id
+              AND ROW({", ".join("t." + c for c in columns)}) IS DISTINCT FROM ROW({", ".join("c." + c for c in columns)})
+        )""")
+
+    query = f"""
+        WITH {", ".join(ctes)}
+        SELECT EXISTS (SELECT 1 FROM patients p JOIN changes c ON p.id = c.id) AS found
+    """
+    return query, [value for _, _, value in values]
+
+# (table, columns, start, stop) of each tumor section within a PATIENT_ROW_COLUMNS tuple
+def _row_sections():
+    sections, start = [], len(PATIENT_COLUMNS)
+    for table, columns in TUMOR_TABLES.items():
+        sections.append((table, columns, start, start + len(columns)))
+        start += len(columns)
+    return sections
+
+ROW_SECTIONS = _row_sections()
+
+def nest_patient_row(row):
+    """Split a PATIENT_ROW_COLUMNS tuple into the patient/tumor_* shape the API returns."""
+    patient = {"patient": dict(zip(PATIENT_COLUMNS, row))}
+    for table, columns, start, stop in ROW_SECTIONS:
+        values = row[start:stop]
+        # A missing tumor row comes back from the LEFT JOIN as all NULLs
+        patient[table] = dict(zip(columns, values)) if any(v is not None for v in values) else None
+    return patient
+
+def patient_values(patient):
+    """Diagnosis followed by the 30 features, in CREATE_PATIENT parameter order."""
+    return (
+        patient.diagnosis,
+        *patient.tumor_mean.model_dump().values(),
+        *patient.tumor_se.model_dump().values(),
+        *patient.tumor_worst.model_dump().values(),
+    )
+
+class DatabaseUnavailable(Exception):
+    pass
+
+class BatchRejected(Exception):
+    """An atomic batch had failing items; nothing was written."""
+
+    def __init__(self, results):
+        super().__init__("Batch rejected, no patients were created")
+        self.results = results
+
+class PatientRepository(ABC):
+    """Patient and tumor storage used by the blocking endpoint implementations."""
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def get_patient(self, patient_id):
+        """{"patient", "tumor_mean", "tumor_se", "tumor_worst"} or None."""
+
+    @abstractmethod
+    def get_last_patient(self):
+        """The most recently inserted patient, same shape as get_patient."""
+
+    @abstractmethod
+    def list_patient_rows(self, after_serial_id, limit):
+        """Up to `limit` patients with serial_id > after_serial_id, as PATIENT_ROW_COLUMNS tuples."""
+
+    def list_patients(self, after_serial_id, limit):
+        """list_patient_rows in nest_patient_row shape."""
+        return [nest_patient_row(row) for row in self.list_patient_rows(after_serial_id, limit)]
+
+    @abstractmethod
+    def export_chunks(self, fetch_size):
+        """Generator of row-tuple lists in EXPORT_COLUMNS order, `fetch_size` rows at a time."""
+
+    @abstractmethod
+    def feature_matrix(self, fetch_size):
+        """(row count, generator of row-tuple lists) in FEATURE_MATRIX_COLUMNS order, from one snapshot."""
+
+    @abstractmethod
+    def refresh_features(self):
+        """Bring patient_features up to date with the patient tables."""
+
+    @abstractmethod
+    def get_features(self, patient_id):
+        """The 30 model features of a patient, or None."""
+
+    @abstractmethod
+    def get_stats(self):
+        """Per-diagnosis feature statistics and histograms, see summarize_stats."""
+
+    @abstractmethod
+    def rebuild_stats(self):
+        """Recompute the cohort statistics from the patient tables."""
+
+    @abstractmethod
+    def create_patient(self, patient):
+        """Insert a patient and its tumor rows, returning its (possibly allocated) ID."""
+
+    @abstractmethod
+    def update_patient(self, patient_id, changes):
+        """Apply the fields present in `changes` (see changed_columns); False if the patient does not exist."""
+
+    @abstractmethod
+    def delete_patient(self, patient_id):
+        """Delete a patient and its tumor rows; False if it did not exist."""
+
+    # Primitives used by create_patients, all running inside _transaction()
+    @abstractmethod
+    def _transaction(self):
+        pass
+
+    @abstractmethod
+    def _allocate_ids(self, tx, count):
+        pass
+
+    @abstractmethod
+    def _insert_patient_rows(self, tx, rows):
+        """Insert (id, diagnosis) rows, skipping existing IDs; returns the inserted IDs."""
+
+    @abstractmethod
+    def _insert_tumor_rows(self, tx, table, columns, rows):
+        pass
+
+    def create_patients(self, patients, atomic):
+        """Insert a batch in one transaction and report a status per item.
+
+        With atomic=True any failing item raises BatchRejected and nothing is
+        written; otherwise the valid items are committed.
+        """
+        results = [{"index": i, "id": p.id, "status": "pending"} for i, p in enumerate(patients)]
+
+        # Reject IDs that appear more than once in the batch
+        seen = set()
+        for result in results:
+            if result["id"] is None:
+                continue
+            if result["id"] in seen:
+                result.update(status="failed", detail="Duplicate ID in batch")
+            seen.add(result["id"])
+
+        with self._transaction() as tx:
+            # Allocate the missing IDs in bulk
+            missing = [r for r in results if r["id"] is None]
+            if missing:
+                for result, new_id in zip(missing, self._allocate_ids(tx, len(missing))):
+                    result["id"] = new_id
+
+            # Patients first; existing IDs are skipped and reported as failed
+            pending = [r for r in results if r["status"] == "pending"]
+            if pending:
+                inserted_ids = self._insert_patient_rows(
+                    tx, [(r["id"], patients[r["index"]].diagnosis) for r in pending]
+                )
+                for result in pending:
+                    if result["id"] in inserted_ids:
+                        result["status"] = "created"
+                    else:
+                        result.update(status="failed", detail="Patient ID already exists")
+
+            if atomic and any(r["status"] == "failed" for r in results):
+                for result in results:
+                    if result["status"] == "created":
+                        result["status"] = "rolled_back"
+                raise BatchRejected(results)
+
+            created = [r for r in results if r["status"] == "created"]
+            for table, columns in TUMOR_TABLES.items() if created else ():
+                self._insert_tumor_rows(
+                    tx, table, columns,
+                    [(r["id"], *getattr(patients[r["index"]], table).model_dump().values()) for r in created]
+                )
+        return results
+
+class PostgresRepository(PatientRepository):
+    """PostgreSQL through the psycopg2 connection pool in app/database.py."""
+
+    def open(self):
+        init_pool()
+
+    def close(self):
+        close_pool()
+
+    @contextmanager
+    def _connection(self):
+        conn = get_connection()
+        if not conn:
+            raise DatabaseUnavailable("Database connection error")
+        try:
+            yield conn
+        finally:
+            release_connection(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _fetch_tumors(self, cursor, patient_id):
+        tumors = {}
+        for table in TUMOR_TABLES:
+            cursor.execute(f"SELECT * FROM {table} WHERE patient_id = %s", (patient_id,))
+            tumors[table] = cursor.fetchone()
+        return tumors
+
+    def get_patient(self, patient_id):
+        with self._connection() as conn, conn.cursor(cursor_factory=DictCursor) as cursor:
+            cursor.execute("SELECT * FROM patients WHERE id = %s", (patient_id,))
+            patient = cursor.fetchone()
+            if not patient:
+                return None
+            return {"patient": patient, **self._fetch_tumors(cursor, patient_id)}
+
+    def get_last_patient(self):
+        with self._connection() as conn, conn.cursor(cursor_factory=DictCursor) as cursor:
+            cursor.execute("SELECT * FROM patients ORDER BY serial_id DESC LIMIT 1")
+            patient = cursor.fetchone()
+            if not patient:
+                return None
+            return {"patient": patient, **self._fetch_tumors(cursor, patient["id"])}
+
+    def list_patient_rows(self, after_serial_id, limit):
+        with self._connection() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+            cursor.execute(
+                PATIENT_SELECT + " WHERE p.serial_id > %s ORDER BY p.serial_id LIMIT %s",
+                (after_serial_id, limit)
+            )
+            return cursor.fetchall()
+
+    def export_chunks(self, fetch_size):
+        # Start the stream now so a dead database fails before the response does
+        chunks = self._stream_rows(EXPORT_SELECT + " ORDER BY p.serial_id", fetch_size)
+        next(chunks)
+        return chunks
+
+    def feature_matrix(self, fetch_size):
+        chunks = self._stream_rows(FEATURE_MATRIX_SELECT, fetch_size, count_query="SELECT COUNT(*) FROM patient_features")
+        return next(chunks), chunks
+
+    def refresh_features(self):
+        with self._transaction() as cursor:
+            # A full refresh can outlast the per-request statement timeout
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY patient_features")
+
+    def _stream_rows(self, query, fetch_size, count_query=None):
+        # The connection is checked out inside the generator, so one that is never
+        # started holds nothing; the first value yielded is the row count (or None)
+        with self._connection() as conn:
+            count = None
+            if count_query:
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    # The count and the streamed rows must come from the same snapshot
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                    cursor.execute(count_query)
+                    count = cursor.fetchone()[0]
+            # A named (server-side) cursor keeps memory flat however large the table is
+            with conn.cursor(name="stream_rows", cursor_factory=TupleCursor) as cursor:
+                cursor.itersize = fetch_size
+                cursor.execute(query)
+                yield count
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def get_features(self, patient_id):
+        with self._connection() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+            cursor.execute(FEATURE_SELECT, (patient_id,))
+            return cursor.fetchone()
+
+    def get_stats(self):
+        with self._connection() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+            cursor.execute(STATS_SELECT)
+            stat_rows = cursor.fetchall()
+            cursor.execute(HISTOGRAM_SELECT)
+            histogram_rows = cursor.fetchall()
+        return summarize_stats(stat_rows, histogram_rows)
+
+    def rebuild_stats(self):
+        with self._transaction() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SELECT rebuild_feature_stats()")
+
+    def create_patient(self, patient):
+        with self._transaction() as cursor:
+            # The ID comes from next_patient_id() when the client did not supply one
+            cursor.execute(CREATE_PATIENT, (patient.id, *patient_values(patient)))
+            return cursor.fetchone()["id"]
+
+    def update_patient(self, patient_id, changes):
+        with self._transaction() as cursor:
+            cursor.execute(*update_patient_query(patient_id, changes))
+            return cursor.fetchone()["found"]
+
+    def delete_patient(self, patient_id):
+        with self._transaction() as cursor:
+            cursor.execute(DELETE_PATIENT, (patient_id,))
+            return cursor.fetchone() is not None
+
+    def _allocate_ids(self, cursor, count):
+        cursor.execute("SELECT next_patient_id() AS id FROM generate_series(1, %s)", (count,))
+        return [row["id"] for row in cursor.fetchall()]
+
+    def _insert_patient_rows(self, cursor, rows):
+        inserted = execute_values(
+            cursor,
+            "INSERT INTO patients (id, diagnosis) VALUES %s ON CONFLICT (id) DO NOTHING RETURNING id",
+            rows, page_size=len(rows), fetch=True,
+        )
+        return {row["id"] for row in inserted}
+
+    def _insert_tumor_rows(self, cursor, table, columns, rows):
+        execute_values(
+            cursor, f"INSERT INTO {table} (patient_id, {', '.join(columns)}) VALUES %s", rows, page_size=len(rows)
+        )
+
+def sqlite_schema(path=SCHEMA_PATH):
+    """Translate the tables and indexes of sqlSchema.sql into SQLite DDL.
+
+    Functions, triggers, procedures and sequences are PL/pgSQL-specific and
+    skipped; SQLiteRepository provides its own equivalents. Materialized views
+    become plain views; indexes on them, and unlogged tables, are dropped. Seed rows (INSERT
+    statements) are kept, skipping rows that already exist.
+    """
+    sql = re.sub(r"--[^\n]*", "", read_schema(path))
+    # Drop dollar-quoted bodies before splitting on semicolons
+    sql = re.sub(r"\$\$.*?\$\$", "", sql, flags=re.S)
+
+    statements = []
+    tables, views = set(), set()
+    for statement in sql.split(";"):
+        statement = " ".join(statement.split())
+        view = re.match(r"CREATE MATERIALIZED VIEW (?:IF NOT EXISTS )?(\w+) AS (.*)", statement, re.I)
+        if view:
+            views.add(view.group(1))
+            statements.append(f"CREATE VIEW IF NOT EXISTS {view.group(1)} AS {view.group(2)}")
+            continue
+        if re.match(r"INSERT INTO\b", statement, re.I):
+            statements.append(re.sub(r"^INSERT INTO", "INSERT OR IGNORE INTO", statement, flags=re.I))
+            continue
+        if not re.match(r"CREATE (TABLE|(UNIQUE )?INDEX)\b", statement, re.I):
+            continue
+        table = re.match(r"CREATE TABLE (?:IF NOT EXISTS )?(\w+)", statement, re.I)
+        if table:
+            tables.add(table.group(1))
+        index = re.match(r"CREATE (UNIQUE )?INDEX .*? ON (\w+)", statement, re.I)
+        if index and index.group(2) not in tables:
+            continue
+        # Re-running against an existing file database must not fail
+        statement = re.sub(r"^CREATE (TABLE|(UNIQUE )?INDEX)( IF NOT EXISTS)?", r"CREATE \1 IF NOT EXISTS", statement, flags=re.I)
+        statement = re.sub(r"\bSERIAL PRIMARY KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", statement, flags=re.I)
+        statement = re.sub(r"\bFLOAT\b", "REAL", statement, flags=re.I)
+        statement = re.sub(r"\bUSING \w+\b", "", statement, flags=re.I)
+        statement = re.sub(r"\bINCLUDE \([^)]*\)", "", statement, flags=re.I)
+        statements.append(statement)
+    return statements
+
+class SQLiteRepository(PatientRepository):
+    """Embedded SQLite storage (in-memory by default) sharing the tables of sqlSchema.sql."""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def open(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode = WAL")
+        for statement in sqlite_schema():
+            conn.execute(statement)
+        # Stand-ins for patient_id_seq/next_patient_id() and trigger_log_diagnosis_change
+        conn.execute("CREATE TABLE IF NOT EXISTS patient_id_seq (value INTEGER NOT NULL)")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trigger_log_diagnosis_change
+            AFTER UPDATE OF diagnosis ON patients
+            WHEN OLD.diagnosis IS NOT NEW.diagnosis
+            BEGIN
+                INSERT INTO patient_changes_log (patient_id, old_diagnosis, new_diagnosis)
+                VALUES (OLD.id, OLD.diagnosis, NEW.diagnosis);
+            END
+        """)
+        # ... and for the tumor_*.diagnosis copies kept by set_tumor_diagnosis/update_patient_stats
+        for table in TUMOR_TABLES:
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trigger_{table}_diagnosis
+                AFTER INSERT ON {table}
+                BEGIN
+                    UPDATE {table} SET diagnosis = (SELECT diagnosis FROM patients WHERE id = NEW.patient_id)
+                    WHERE id = NEW.id;
+                END
+            """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trigger_patient_stats_diagnosis
+            AFTER UPDATE OF diagnosis ON patients
+            WHEN OLD.diagnosis IS NOT NEW.diagnosis
+            BEGIN
+                {" ".join(f"UPDATE {table} SET diagnosis = NEW.diagnosis WHERE patient_id = NEW.id;" for table in TUMOR_TABLES)}
+            END
+        """)
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _execute(self, query, params=()):
+        start = time.perf_counter()
+        try:
+            return self._conn.execute(query.replace("%s", "?"), params)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+    def _fetch_one(self, query, params=()):
+        row = self._execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.open()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def _reading(self):
+        with self._lock:
+            self.open()
+            yield
+
+    def _fetch_tumors(self, patient_id):
+        return {
+            table: self._fetch_one(f"SELECT * FROM {table} WHERE patient_id = %s", (patient_id,))
+            for table in TUMOR_TABLES
+        }
+
+    def get_patient(self, patient_id):
+        with self._reading():
+            patient = self._fetch_one("SELECT * FROM patients WHERE id = %s", (patient_id,))
+            if not patient:
+                return None
+            return {"patient": patient, **self._fetch_tumors(patient_id)}
+
+    def get_last_patient(self):
+        with self._reading():
+            patient = self._fetch_one("SELECT * FROM patients ORDER BY serial_id DESC LIMIT 1")
+            if not patient:
+                return None
+            return {"patient": patient, **self._fetch_tumors(patient["id"])}
+
+    def list_patient_rows(self, after_serial_id, limit):
+        with self._reading():
+            cursor = self._conn.cursor()
+            cursor.row_factory = None
+            query = PATIENT_SELECT + " WHERE p.serial_id > ? ORDER BY p.serial_id LIMIT ?"
+            start = time.perf_counter()
+            rows = cursor.execute(query, (after_serial_id, limit)).fetchall()
+            record_query(query, time.perf_counter() - start)
+        return rows
+
+    def export_chunks(self, fetch_size):
+        self.open()
+        return self._stream_export(fetch_size)
+
+    def _stream_export(self, fetch_size):
+        # Keyset chunks so writers are only blocked while one chunk is read
+        after = 0
+        while True:
+            with self._reading():
+                rows = self._execute(
+                    f"SELECT p.serial_id, p.id, p.diagnosis, {FEATURE_FIELDS} {EXPORT_FROM}"
+                    " WHERE p.serial_id > %s ORDER BY p.serial_id LIMIT %s",
+                    (after, fetch_size)
+                ).fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            yield [tuple(row)[1:] for row in rows]
+            if len(rows) < fetch_size:
+                break
+
+    def feature_matrix(self, fetch_size):
+        # Read everything under the lock so the count matches the rows
+        with self._reading():
+            cursor = self._conn.cursor()
+            cursor.row_factory = None
+            start = time.perf_counter()
+            rows = cursor.execute(FEATURE_MATRIX_SELECT).fetchall()
+            record_query(FEATURE_MATRIX_SELECT, time.perf_counter() - start)
+        return len(rows), (rows[i:i + fetch_size] for i in range(0, len(rows), fetch_size))
+
+    def refresh_features(self):
+        # patient_features is a plain view in SQLite, always current
+        pass
+
+    def get_features(self, patient_id):
+        with self._reading():
+            row = self._execute(FEATURE_SELECT, (patient_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def get_stats(self):
+        # No stats triggers here; the embedded backend aggregates on demand instead
+        stat_rows, histogram_rows = [], []
+        with self._reading():
+            for table, columns in TUMOR_TABLES.items():
+                sums = ", ".join(f"COUNT(t.{c}), SUM(t.{c}), SUM(t.{c} * t.{c})" for c in columns)
+                for row in self._execute(
+                    f"SELECT p.diagnosis, {sums} FROM patients p JOIN {table} t ON t.patient_id = p.id GROUP BY p.diagnosis"
+                ).fetchall():
+                    for i, column in enumerate(columns):
+                        n, total, total_sq = row[1 + 3 * i:4 + 3 * i]
+                        if n:
+                            stat_rows.append((row[0], column, n, total, total_sq))
+
+            for feature, low, high, buckets in self._execute(
+                "SELECT feature, low, high, buckets FROM histogram_bins"
+            ).fetchall():
+                table = next((t for t, columns in TUMOR_TABLES.items() if feature in columns), None)
+                if table is None:
+                    continue
+                # width_bucket() semantics
+                bucket_sql = (
+                    f"CASE WHEN t.{feature} < %s THEN 0 WHEN t.{feature} >= %s THEN %s"
+                    f" ELSE CAST((t.{feature} - %s) * %s / (%s - %s) AS INTEGER) + 1 END"
+                )
+                for diagnosis, bucket, count in self._execute(
+                    f"SELECT p.diagnosis, {bucket_sql}, COUNT(*) FROM patients p JOIN {table} t ON t.patient_id = p.id"
+                    f" WHERE t.{feature} IS NOT NULL GROUP BY 1, 2",
+                    (low, high, buckets + 1, low, buckets, high, low)
+                ).fetchall():
+                    histogram_rows.append((diagnosis, feature, bucket, count, low, high, buckets))
+        return summarize_stats(stat_rows, histogram_rows)
+
+    def rebuild_stats(self):
+        # get_stats always reads the patient tables directly
+        pass
+
+    def create_patient(self, patient):
+        with self._transaction():
+            patient_id = patient.id if patient.id is not None else self._allocate_ids(self, 1)[0]
+            self._execute("INSERT INTO patients (id, diagnosis) VALUES (%s, %s)", (patient_id, patient.diagnosis))
+            for table, columns in TUMOR_TABLES.items():
+                self._insert_tumor_rows(self, table, columns, [(patient_id, *getattr(patient, table).model_dump().values())])
+        return patient_id
+
+    def update_patient(self, patient_id, changes):
+        # SQLite has no data-modifying CTEs; statements are in-process, so one per table is cheap
+        with self._transaction():
+            if not self._execute("SELECT 1 FROM patients WHERE id = %s", (patient_id,)).fetchone():
+                return False
+            for table, columns in changed_columns(changes):
+                self._execute(
+                    f"UPDATE {table} SET {', '.join(c + ' = %s' for c in columns)}"
+                    f" WHERE {key_column(table)} = %s AND ({' OR '.join(c + ' IS NOT %s' for c in columns)})",
+                    (*columns.values(), patient_id, *columns.values())
+                )
+            return True
+
+    def delete_patient(self, patient_id):
+        # PRAGMA foreign_keys = ON makes the ON DELETE CASCADE apply here too
+        with self._transaction():
+            return self._execute("DELETE FROM patients WHERE id = %s", (patient_id,)).rowcount > 0
+
+    def _allocate_ids(self, tx, count):
+        # Same contract as next_patient_id(): 5-6 digit IDs, skipping ones already in use
+        row = self._execute("SELECT value FROM patient_id_seq").fetchone()
+        value = row[0] if row else 9999
+        ids = []
+        while len(ids) < count:
+            value += 1
+            if value > 999999:
+                raise RuntimeError("Patient ID space exhausted")
+            if not self._execute("SELECT 1 FROM patients WHERE id = %s", (str(value),)).fetchone():
+                ids.append(str(value))
+        if row:
+            self._execute("UPDATE patient_id_seq SET value = %s", (value,))
+        else:
+            self._execute("INSERT INTO patient_id_seq (value) VALUES (%s)", (value,))
+        return ids
+
+    def _insert_patient_rows(self, tx, rows):
+        inserted = set()
+        for patient_id, diagnosis in rows:
+            cursor = self._execute(
+                "INSERT INTO patients (id, diagnosis) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
+                (patient_id, diagnosis)
+            )
+            if cursor.rowcount:
+                inserted.add(patient_id)
+        return inserted
+
+    def _insert_tumor_rows(self, tx, table, columns, rows):
+        placeholders = ", ".join(["?"] * (len(columns) + 1))
+        start = time.perf_counter()
+        self._conn.executemany(f"INSERT INTO {table} (patient_id, {', '.join(columns)}) VALUES ({placeholders})", rows)
+        record_query(f"INSERT INTO {table}", time.perf_counter() - start)
+
+def create_repository(backend=STORAGE_BACKEND):
+    if backend == "postgres":
+        return PostgresRepository()
+    if backend == "sqlite":
+        return SQLiteRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+repository = create_repository()
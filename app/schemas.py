@@ -0,0 +1,101 @@
+from pydantic import BaseModel
+from typing import Optional
+
+# Pydantic models for request/response validation
+class TumorMean(BaseModel):
+    radius_mean: float
+    texture_mean: float
+    perimeter_mean: float
+    area_mean: float
+    smoothness_mean: float
+    compactness_mean: float
+    concavity_mean: float
+    concave_points_mean: float
+    symmetry_mean: float
+    fractal_dimension_mean: float
+
+class TumorSE(BaseModel):
+    radius_se: float
+    texture_se: float
+    perimeter_se: float
+    area_se: float
+    smoothness_se: float
+    compactness_se: float
+    concavity_se: float
+    concave_points_se: float
+    symmetry_se: float
+    fractal_dimension_se: float
+
+class TumorWorst(BaseModel):
+    radius_worst: float
+    texture_worst: float
+    perimeter_worst: float
+    area_worst: float
+    smoothness_worst: float
+    compactness_worst: float
+    concavity_worst: float
+    concave_points_worst: float
+    symmetry_worst: float
+    fractal_dimension_worst: float
+
+class Patient(BaseModel):
+    id: Optional[str] = None
+    diagnosis: str
+    tumor_mean: TumorMean
+    tumor_se: TumorSE
+    tumor_worst: TumorWorst
+
+# Partial update (PATCH): only the supplied fields are written
+class TumorMeanPatch(BaseModel):
+    radius_mean: Optional[float] = None
+    texture_mean: Optional[float] = None
+    perimeter_mean: Optional[float] = None
+    area_mean: Optional[float] = None
+    smoothness_mean: Optional[float] = None
+    compactness_mean: Optional[float] = None
+    concavity_mean: Optional[float] = None
+    concave_points_mean: Optional[float] = None
+    symmetry_mean: Optional[float] = None
+    fractal_dimension_mean: Optional[float] = None
+
+class TumorSEPatch(BaseModel):
+    radius_se: Optional[float] = None
+    texture_se: Optional[float] = None
+    perimeter_se: Optional[float] = None
+    area_se: Optional[float] = None
+    smoothness_se: Optional[float] = None
+    compactness_se: Optional[float] = None
+    concavity_se: Optional[float] = None
+    concave_points_se: Optional[float] = None
+    symmetry_se: Optional[float] = None
+    fractal_dimension_se: Optional[float] = None
+
+class TumorWorstPatch(BaseModel):
+    radius_worst: Optional[float] = None
+    texture_worst: Optional[float] = None
+    perimeter_worst: Optional[float] = None
+    area_worst: Optional[float] = None
+    smoothness_worst: Optional[float] = None
+    compactness_worst: Optional[float] = None
+    concavity_worst: Optional[float] = None
+    concave_points_worst: Optional[float] = None
+    symmetry_worst: Optional[float] = None
+    fractal_dimension_worst: Optional[float] = None
+
+class PatientPatch(BaseModel):
+    diagnosis: Optional[str] = None
+    tumor_mean: Optional[TumorMeanPatch] = None
+    tumor_se: Optional[TumorSEPatch] = None
+    tumor_worst: Optional[TumorWorstPatch] = None
+
+# Raw feature payload for scoring without a stored patient
+class PatientFeatures(BaseModel):
+    tumor_mean: TumorMean
+    tumor_se: TumorSE
+    tumor_worst: TumorWorst
+
+# Column layout of each table, in the order the model and dataset use
+PATIENT_COLUMNS = ["serial_id", "id", "diagnosis", "created_at"]
+TUMOR_MEAN_COLUMNS = list(TumorMean.model_fields)
+TUMOR_SE_COLUMNS = list(TumorSE.model_fields)
+TUMOR_WORST_COLUMNS = list(TumorWorst.model_fields)
@@ -0,0 +1,161 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from app.database import get_connection, release_connection, _connection_params, TupleCursor
+from app.model import FEATURE_COLUMNS, load_model, get_model, model_path, model_version, malignant_column
+
+# Tables below this size are scored in-process even when workers are requested
+PARALLEL_THRESHOLD = 200000
+
+TABLE_ALIASES = {"mean": "m", "se": "s", "worst": "w"}
+
+# One chunk of patients with their features, missing values scored as 0 like preprocess_data
+SCORE_SELECT = f"""
+    SELECT p.serial_id, p.id,
+           {", ".join(f"COALESCE({TABLE_ALIASES[c.rsplit('_', 1)[1]]}.{c}, 0)" for c in FEATURE_COLUMNS)}
+    FROM patients p
+    LEFT JOIN tumor_mean m ON m.patient_id = p.id
+    LEFT JOIN tumor_se s ON s.patient_id = p.id
+    LEFT JOIN tumor_worst w ON w.patient_id = p.id
+    WHERE p.serial_id > %s AND p.serial_id <= %s
+    ORDER BY p.serial_id
+    LIMIT %s
+"""
+
+SAVE_PREDICTIONS = """
+    INSERT INTO predictions (patient_id, model_version, prediction, probability_malignant, scored_at)
+    VALUES %s
+    ON CONFLICT (patient_id, model_version) DO UPDATE SET
+        prediction = EXCLUDED.prediction,
+        probability_malignant = EXCLUDED.probability_malignant,
+        scored_at = EXCLUDED.scored_at
+"""
+
+_job_lock = threading.Lock()
+_job_status = {"state": "idle"}
+
+def score_range(conn, model, version, scored_at, low, high, chunk_size):
+    """Score patients with low < serial_id <= high, one predict_proba call per chunk."""
+    n_features = len(FEATURE_COLUMNS)
+    malignant = malignant_column(model)
+    scored = 0
+
+    while True:
+        with conn.cursor(cursor_factory=TupleCursor) as cursor:
+            cursor.execute(SCORE_SELECT, (low, high, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            # Fill one contiguous float64 matrix straight from the row tuples
+            n = len(rows)
+            X = np.fromiter(
+                itertools.chain.from_iterable(row[2:] for row in rows),
+                dtype=np.float64, count=n * n_features
+            ).reshape(n, n_features)
+
+            probabilities = model.predict_proba(X)[:, malignant]
+            labels = (probabilities > 0.5).astype(np.int16)
+
+            execute_values(
+                cursor,
+                SAVE_PREDICTIONS,
+                [
+                    (row[1], version, label, probability, scored_at)
+                    for row, label, probability in zip(rows, labels.tolist(), probabilities.tolist())
+                ],
+                page_size=n,
+            )
+            conn.commit()
+
+        scored += n
+        low = rows[-1][0]
+        if n < chunk_size:
+            break
+
+    return scored
+
+# Entry point of a worker process: own connection, own copy of the model
+def _score_partition(args):
+    path, version, scored_at, low, high, chunk_size = args
+    model = load_model(path)
+    conn = psycopg2.connect(**_connection_params())
+    try:
+        return score_range(conn, model, version, scored_at, low, high, chunk_size)
+    finally:
+        conn.close()
+
+def score_all(chunk_size=10000, workers=1):
+    """Score every patient with the loaded model and store the results in predictions."""
+    model = get_model() or load_model()
+    version = model_version()
+    scored_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    started = time.perf_counter()
+
+    conn = get_connection()
+    if not conn:
+        raise RuntimeError("Database connection error")
+
+    try:
+        with conn.cursor(cursor_factory=TupleCursor) as cursor:
+            cursor.execute("SELECT MIN(serial_id), MAX(serial_id), COUNT(*) FROM patients")
+            first, last, total = cursor.fetchone()
+        conn.commit()
+
+        if not total:
+            scored = 0
+        elif workers > 1 and total >= PARALLEL_THRESHOLD:
+            # Split the serial_id range into one slice per worker
+            bounds = np.linspace(first - 1, last, workers + 1).astype(np.int64).tolist()
+            partitions = [
+                (model_path(), version, scored_at, low, high, chunk_size)
+                for low, high in zip(bounds[:-1], bounds[1:])
+            ]
+            # Release the pooled connection while the workers run
+            release_connection(conn)
+            conn = None
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                scored = sum(pool.map(_score_partition, partitions))
+        else:
+            workers = 1
+            scored = score_range(conn, model, version, scored_at, first - 1, last, chunk_size)
+    finally:
+        release_connection(conn)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "model_version": version,
+        "scored_at": scored_at.isoformat(),
+        "scored": scored,
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(scored / elapsed, 1) if elapsed else 0.0,
+    }
+
+def start_job():
+    """Mark a background scoring run as started; False if one is already running."""
+    with _job_lock:
+        if _job_status["state"] == "running":
+            return False
+        _job_status.clear()
+        _job_status.update(state="running", started_at=datetime.now(timezone.utc).isoformat())
+        return True
+
+def run_job(chunk_size, workers):
+    try:
+        result = score_all(chunk_size, workers)
+        with _job_lock:
+            _job_status.update(state="finished", result=result)
+    except Exception as e:
+        with _job_lock:
+            _job_status.update(state="failed", error=str(e))
+
+def job_status():
+    with _job_lock:
+        return dict(_job_status)
@@ -0,0 +1,55 @@
+import json
+import math
+from datetime import date, datetime, time
+from fastapi.responses import Response
+
+# orjson is several times faster than the stdlib encoder and serializes datetimes
+# and numpy values natively; without it responses fall back to json.dumps
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _plain(value):
+    """`value` with the conversions orjson makes itself: NaN/inf to None, dates to ISO 8601, numpy to lists."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (str, int)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {k.isoformat() if isinstance(k, (date, time)) else k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    # numpy scalars and arrays
+    if hasattr(value, "tolist"):
+        return _plain(value.tolist())
+    return value
+
+def dumps(content):
+    """Encode `content` as compact UTF-8 JSON bytes (NaN becomes null)."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        _plain(content), separators=(",", ":"), ensure_ascii=False, allow_nan=False, default=str
+    ).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson when available.
+
+    Returning one directly from an endpoint also skips FastAPI's
+    jsonable_encoder pass, so the content must already be plain
+    dicts/lists/tuples of JSON-compatible values.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+def columnar(columns, rows):
+    """{"columns": [...], "values": [[...], ...]}: one value array per column instead of one object per row."""
+    if not rows:
+        return {"columns": columns, "values": [[] for _ in columns]}
+    return {"columns": columns, "values": [list(values) for values in zip(*rows)]}
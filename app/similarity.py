@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+import numpy as np
+from app.schemas import TUMOR_MEAN_COLUMNS, TUMOR_SE_COLUMNS, TUMOR_WORST_COLUMNS
+
+# Keep the similar-patients index in memory (SIMILARITY_INDEX=0 disables it)
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_INDEX", "1") == "1"
+# Rows scanned per matrix-vector product during a search
+SIMILARITY_BLOCK_SIZE = int(os.getenv("SIMILARITY_BLOCK_SIZE", "262144"))
+SIMILARITY_BUILD_FETCH_SIZE = 10000
+
+N_FEATURES = len(TUMOR_MEAN_COLUMNS) + len(TUMOR_SE_COLUMNS) + len(TUMOR_WORST_COLUMNS)
+
+def feature_vector(record):
+    """The 30 features of a {"tumor_mean": {...}, "tumor_se": {...}, "tumor_worst": {...}} record."""
+    return (
+        [record["tumor_mean"][c] for c in TUMOR_MEAN_COLUMNS]
+        + [record["tumor_se"][c] for c in TUMOR_SE_COLUMNS]
+        + [record["tumor_worst"][c] for c in TUMOR_WORST_COLUMNS]
+    )
+
+class SimilarityIndex:
+    """Exact k-nearest-neighbour search over standardized feature vectors.
+
+    Vectors live in one dense float32 matrix, searched block by block with a
+    matrix-vector product and argpartition. Deletes move the last row into
+    the freed slot, so the matrix never has holes. The standardization
+    (mean/std) is fixed when the index is built; building again refreshes it.
+    """
+
+    def __init__(self, block_size=SIMILARITY_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._vectors = np.empty((0, N_FEATURES), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._ids = []
+        self._diagnoses = []
+        self._positions = {}
+        self._mean = np.zeros(N_FEATURES)
+        self._scale = np.ones(N_FEATURES)
+        self._ready = False
+        self._building = False
+        self._pending = []
+        self.built_at = None
+        self.build_seconds = None
+
+    def _standardize(self, features):
+        x = (np.asarray(features, dtype=np.float64) - self._mean) / self._scale
+        # Missing features sit at the mean
+        return np.nan_to_num(x, nan=0.0).astype(np.float32)
+
+    def build(self, chunks):
+        """Rebuild from chunks of (id, diagnosis, 30 features) rows, e.g. repository.export_chunks()."""
+        started = time.perf_counter()
+        with self._lock:
+            self._building = True
+            self._pending = []
+
+        try:
+            ids, diagnoses, blocks = [], [], []
+            for rows in chunks:
+                ids.extend(row[0] for row in rows)
+                diagnoses.extend(row[1] for row in rows)
+                blocks.append(np.array([row[2:] for row in rows], dtype=np.float64))
+            raw = np.concatenate(blocks) if blocks else np.empty((0, N_FEATURES))
+
+            mean = np.nanmean(raw, axis=0) if len(raw) else np.zeros(N_FEATURES)
+            scale = np.nanstd(raw, axis=0) if len(raw) else np.ones(N_FEATURES)
+            mean = np.nan_to_num(mean)
+            scale = np.nan_to_num(scale)
+            # A constant column's std is rounding noise relative to its values, not 0;
+            # leave such columns unscaled like sklearn's _handle_zeros_in_scale
+            scale = np.where(scale < 10 * np.finfo(np.float64).eps * np.maximum(np.abs(mean), 1.0), 1.0, scale)
+            vectors = np.nan_to_num((raw - mean) / scale, nan=0.0).astype(np.float32)
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+
+        with self._lock:
+            self._mean, self._scale = mean, scale
+            self._vectors = vectors
+            self._norms = np.einsum("ij,ij->i", vectors, vectors)
+            self._ids = ids
+            self._diagnoses = diagnoses
+            self._positions = {patient_id: i for i, patient_id in enumerate(ids)}
+            # Writes that arrived while the rows were being read win over the snapshot
+            for change in self._pending:
+                change[0](*change[1:])
+            self._pending = []
+            self._building = False
+            self._ready = True
+            self.built_at = time.time()
+            self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self._vectors))
+        vectors = np.empty((capacity, N_FEATURES), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float32)
+        size = len(self._ids)
+        vectors[:size] = self._vectors[:size]
+        norms[:size] = self._norms[:size]
+        self._vectors, self._norms = vectors, norms
+
+    def _upsert(self, patient_id, diagnosis, features):
+        vector = self._standardize(features)
+        position = self._positions.get(patient_id)
+        if position is None:
+            position = len(self._ids)
+            if position >= len(self._vectors):
+                self._grow()
+            self._ids.append(patient_id)
+            self._diagnoses.append(diagnosis)
+            self._positions[patient_id] = position
+        else:
+            self._diagnoses[position] = diagnosis
+        self._vectors[position] = vector
+        self._norms[position] = vector @ vector
+
+    def _remove(self, patient_id):
+        position = self._positions.pop(patient_id, None)
+        if position is None:
+            return
+        last = len(self._ids) - 1
+        if position != last:
+            # Move the last row into the hole
+            self._vectors[position] = self._vectors[last]
+            self._norms[position] = self._norms[last]
+            self._ids[position] = self._ids[last]
+            self._diagnoses[position] = self._diagnoses[last]
+            self._positions[self._ids[position]] = position
+        self._ids.pop()
+        self._diagnoses.pop()
+
+    def upsert(self, patient_id, diagnosis, features):
+        with self._lock:
+            if self._building:
+                self._pending.append((self._upsert, patient_id, diagnosis, list(features)))
+            else:
+                self._upsert(patient_id, diagnosis, features)
+
+    def remove(self, patient_id):
+        with self._lock:
+            if self._building:
+                self._pending.append((self._remove, patient_id))
+            else:
+                self._remove(patient_id)
+
+    def ready(self):
+        return self._ready
+
+    def similar(self, patient_id, k):
+        """The k nearest other patients as [{"id", "diagnosis", "distance"}], or None if not indexed."""
+        with self._lock:
+            position = self._positions.get(patient_id)
+            if position is None:
+                return None
+            size = len(self._ids)
+            query = self._vectors[position].copy()
+            k = min(k, size - 1)
+            if k <= 0:
+                return []
+
+            best_distances = np.empty(0, dtype=np.float32)
+            best_positions = np.empty(0, dtype=np.int64)
+            for start in range(0, size, self.block_size):
+                stop = min(start + self.block_size, size)
+                # ||x - q||^2 without the constant ||q||^2 term
+                distances = self._norms[start:stop] - 2 * (self._vectors[start:stop] @ query)
+                if start <= position < stop:
+                    distances[position - start] = np.inf
+                top = min(k, stop - start)
+                candidates = np.argpartition(distances, top - 1)[:top]
+                best_distances = np.concatenate([best_distances, distances[candidates]])
+                best_positions = np.concatenate([best_positions, candidates + start])
+                if len(best_distances) > k:
+                    keep = np.argpartition(best_distances, k - 1)[:k]
+                    best_distances, best_positions = best_distances[keep], best_positions[keep]
+
+            order = np.argsort(best_distances)
+            distances = np.sqrt(np.maximum(best_distances[order] + query @ query, 0.0))
+            return [
+                {"id": self._ids[i], "diagnosis": self._diagnoses[i], "distance": float(d)}
+                for i, d in zip(best_positions[order].tolist(), distances.tolist())
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": SIMILARITY_ENABLED,
+                "ready": self._ready,
+                "building": self._building,
+                "size": len(self._ids),
+                "capacity": len(self._vectors),
+                "built_at": self.built_at,
+                "build_seconds": self.build_seconds,
+            }
+
+similarity_index = SimilarityIndex()
+
+def index_patient(patient_id, diagnosis, record):
+    """Add or refresh a patient after a write (no-op when disabled or a tumor row is missing)."""
+    if not SIMILARITY_ENABLED:
+        return
+    if any(record.get(table) is None for table in ("tumor_mean", "tumor_se", "tumor_worst")):
+        return
+    similarity_index.upsert(patient_id, diagnosis, feature_vector(record))
+
+def unindex_patient(patient_id):
+    if SIMILARITY_ENABLED:
+        similarity_index.remove(patient_id)
@@ -0,0 +1,166 @@
+"""Check the query plans of the statements the API issues against a seeded database.
+
+Seeds the database with synthetic patients (like run_benchmarks.py), runs
+ANALYZE, then EXPLAINs every per-request statement with sample parameters,
+plus the lookups PostgreSQL runs on their behalf (foreign key checks, ON
+DELETE CASCADE deletes and the statistics triggers), which EXPLAIN does not
+show. Exits with status 1 if any of them plans a sequential scan on a table
+with at least --min-rows rows.
+
+Batch statements that read whole tables by design (export, feature matrix,
+scoring, statistics rebuild) are explained and reported but never fail the
+check.
+
+    python -m benchmarks.explain_queries --database-url postgresql://... \\
+        --reset-schema --patients 20000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def seed(patients):
+    """Load `patients` synthetic patients with `load_data.py --bulk`."""
+    from benchmarks.run_benchmarks import DATASET, LOADER
+    from benchmarks.synthetic import load_distributions, generate_patients, write_csv
+
+    df = generate_patients(load_distributions(DATASET), patients)
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "data.csv")
+        write_csv(df, csv_path)
+        completed = subprocess.run(
+            [sys.executable, LOADER, "--bulk", "--input", csv_path], cwd=workdir, capture_output=True, text=True
+        )
+    if completed.returncode != 0:
+        print(completed.stdout[-2000:], completed.stderr[-2000:], file=sys.stderr)
+        raise SystemExit("Seeding with load_data.py --bulk failed")
+
+def checked_queries(cursor):
+    """(name, query, params) of the statements that must use indexes on large tables."""
+    from app.repository import (
+        TUMOR_TABLES, FEATURE_COLUMNS, PATIENT_SELECT, FEATURE_SELECT, CREATE_PATIENT, DELETE_PATIENT,
+        STATS_SELECT, HISTOGRAM_SELECT, update_patient_query,
+    )
+
+    # A patient from the middle of the table, so no plan benefits from an edge case
+    cursor.execute("SELECT id, serial_id FROM patients ORDER BY serial_id OFFSET (SELECT COUNT(*) / 2 FROM patients) LIMIT 1")
+    row = cursor.fetchone()
+    if not row:
+        raise SystemExit("The database has no patients; seed it first (--patients)")
+    patient_id, serial_id = row
+    features = [1.0] * len(FEATURE_COLUMNS)
+    changes = {"diagnosis": "B", **{table: {columns[0]: 1.0} for table, columns in TUMOR_TABLES.items()}}
+
+    queries = [
+        ("get_patient", "SELECT * FROM patients WHERE id = %s", (patient_id,)),
+        ("get_last_patient", "SELECT * FROM patients ORDER BY serial_id DESC LIMIT 1", ()),
+        ("list_patients", PATIENT_SELECT + " WHERE p.serial_id > %s ORDER BY p.serial_id LIMIT %s", (serial_id, 100)),
+        ("get_features", FEATURE_SELECT, (patient_id,)),
+        ("create_patient", CREATE_PATIENT, ("explain-check", "M", *features)),
+        ("update_patient", *update_patient_query(patient_id, changes)),
+        ("delete_patient", DELETE_PATIENT, (patient_id,)),
+        ("insert_patient_rows", "INSERT INTO patients (id, diagnosis) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING RETURNING id",
+         ("explain-check", "M")),
+        ("allocate_id", "SELECT 1 FROM patients WHERE id = %s", (patient_id,)),
+        ("get_stats", STATS_SELECT, ()),
+        ("get_stats_histograms", HISTOGRAM_SELECT, ()),
+        # Foreign key check of every tumor/prediction insert
+        ("fk_check_patients", "SELECT 1 FROM ONLY patients x WHERE id = %s FOR KEY SHARE OF x", (patient_id,)),
+    ]
+    for table in TUMOR_TABLES:
+        queries += [
+            (f"get_{table}", f"SELECT * FROM {table} WHERE patient_id = %s", (patient_id,)),
+            # update_patient_stats() moves the rows to the new diagnosis
+            (f"stats_trigger_{table}", f"UPDATE {table} SET diagnosis = %s WHERE patient_id = %s", ("B", patient_id)),
+        ]
+    # ON DELETE CASCADE runs one delete per referencing table
+    for table in [*TUMOR_TABLES, "predictions", "patient_row_hashes", "patient_changes_log"]:
+        queries.append((f"cascade_{table}", f"DELETE FROM ONLY {table} WHERE patient_id = %s", (patient_id,)))
+    return queries
+
+def scan_queries():
+    """(name, query, params) of the batch statements that read whole tables anyway."""
+    from app.repository import EXPORT_SELECT, FEATURE_MATRIX_SELECT
+    from app.scoring import SCORE_SELECT
+
+    return [
+        ("export", EXPORT_SELECT + " ORDER BY p.serial_id", ()),
+        ("feature_matrix", FEATURE_MATRIX_SELECT, ()),
+        ("score_chunk", SCORE_SELECT, (0, 2 ** 31 - 1, 10000)),
+        ("score_bounds", "SELECT MIN(serial_id), MAX(serial_id), COUNT(*) FROM patients", ()),
+    ]
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def explain(cursor, query, params):
+    """Root plan node of `query`; EXPLAIN without ANALYZE, so nothing is written."""
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0]
+    # psycopg2 parses json columns, older servers return the plan as text
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if an API query plans a sequential scan on a large table")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="PostgreSQL URL of a scratch database (default: $DATABASE_URL)")
+    parser.add_argument("--reset-schema", action="store_true",
+                        help="recreate the schema from databases/sqlSchema.sql first (drops all data)")
+    parser.add_argument("--patients", type=int, default=20000,
+                        help="synthetic patients to seed (0 to check the data already loaded)")
+    parser.add_argument("--min-rows", type=int, default=10000,
+                        help="tables with at least this many rows must not be sequentially scanned")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+    sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.run_benchmarks import configure_database_env, reset_schema
+    import psycopg2
+
+    configure_database_env(args.database_url)
+    if args.reset_schema:
+        reset_schema()
+    if args.patients:
+        seed(args.patients)
+
+    conn = psycopg2.connect(args.database_url)
+    conn.autocommit = True
+    violations = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'm')")
+            rows = {relname: int(reltuples) for relname, reltuples in cursor.fetchall()}
+            large = {relname for relname, count in rows.items() if count >= args.min_rows}
+
+            queries = [(name, query, params, True) for name, query, params in checked_queries(cursor)]
+            queries += [(name, query, params, False) for name, query, params in scan_queries()]
+            for name, query, params, checked in queries:
+                nodes = list(plan_nodes(explain(cursor, query, params)))
+                seq_scans = sorted({n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"})
+                flagged = [relname for relname in seq_scans if relname in large] if checked else []
+                if flagged:
+                    violations.append(name)
+                status = "FAIL" if flagged else ("ok" if checked else "scan")
+                scans = ", ".join(f"{relname} ({rows.get(relname, 0)} rows)" for relname in seq_scans)
+                print(f"{status:4}  {name:28} {nodes[0]['Node Type']}" + (f"; seq scan on {scans}" if scans else ""))
+    finally:
+        conn.close()
+
+    if violations:
+        print(f"\n{len(violations)} queries sequentially scan a table with >= {args.min_rows} rows: {', '.join(violations)}")
+        sys.exit(1)
+    print(f"\nNo sequential scans on tables with >= {args.min_rows} rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Benchmark and load-test the API, the bulk loader and the scoring paths.
+
+Seeds the database with synthetic patients drawn from dataset/data.csv, then
+drives every endpoint at each concurrency level and prints (or writes) one
+JSON report with p50/p95/p99 latency, throughput and error rate per scenario,
+so runs can be compared between commits.
+
+    python -m benchmarks.run_benchmarks --database-url postgresql://... \\
+        --reset-schema --patients 10000 --concurrency 1 8 32 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(REPO_ROOT, "dataset", "data.csv")
+SCHEMA = os.path.join(REPO_ROOT, "databases", "sqlSchema.sql")
+LOADER = os.path.join(REPO_ROOT, "databases", "load_data.py")
+
+def summarize(name, latencies, errors, elapsed, **extra):
+    latencies_ms = np.asarray(latencies) * 1000
+    total = len(latencies)
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if total else (0.0, 0.0, 0.0)
+    return {
+        "name": name,
+        **extra,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_per_second": total / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "mean": float(latencies_ms.mean()) if total else 0.0,
+            "max": float(latencies_ms.max()) if total else 0.0,
+        },
+    }
+
+def configure_database_env(database_url):
+    """Point both the app (DB_*) and load_data.py (DATABASE_URL) at one database."""
+    os.environ["DATABASE_URL"] = database_url
+    parsed = urlparse(database_url)
+    os.environ["DB_NAME"] = parsed.path[1:]
+    os.environ["DB_USER"] = parsed.username or ""
+    os.environ["DB_PASSWORD"] = parsed.password or ""
+    os.environ["DB_HOST"] = parsed.hostname or "localhost"
+    os.environ["DB_PORT"] = str(parsed.port or 5432)
+
+def reset_schema():
+    import psycopg2
+    from app.repository import read_schema
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(read_schema(SCHEMA))
+        conn.commit()
+    finally:
+        conn.close()
+
+def bench_load(patients_df, workdir):
+    """Load the synthetic CSV with `load_data.py --bulk` and time it."""
+    from benchmarks.synthetic import write_csv
+
+    csv_path = os.path.join(workdir, "data.csv")
+    write_csv(patients_df, csv_path)
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, LOADER, "--bulk", "--input", csv_path],
+        cwd=workdir, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        print(completed.stdout[-2000:], completed.stderr[-2000:], file=sys.stderr)
+
+    result = summarize("load_data --bulk", [elapsed], int(completed.returncode != 0), elapsed)
+    result["rows"] = len(patients_df)
+    result["rows_per_second"] = len(patients_df) / elapsed if elapsed else 0.0
+    return result
+
+class Scenario:
+    def __init__(self, name, request, max_requests=None, expected=(200, 202)):
+        self.name = name
+        self.request = request  # i -> (method, url, json body or None)
+        self.max_requests = max_requests
+        self.expected = expected
+
+def build_scenarios(patients_df, created_ids, batch_size):
+    from benchmarks.synthetic import to_payload
+
+    rows = patients_df.to_dict("records")
+    ids = [row["id"] for row in rows]
+
+    def pick(i):
+        return ids[i % len(ids)]
+
+    def created(i):
+        return created_ids[i % len(created_ids)] if created_ids else pick(i)
+
+    return [
+        Scenario("GET /", lambda i: ("GET", "/?limit=100", None)),
+        Scenario("GET /export", lambda i: ("GET", "/export?format=csv", None), max_requests=20),
+        Scenario("GET /patients/last", lambda i: ("GET", "/patients/last", None)),
+        Scenario("GET /patients/{id}", lambda i: ("GET", f"/patients/{pick(i)}", None)),
+        Scenario("GET /patients/{id}/predict", lambda i: ("GET", f"/patients/{pick(i)}/predict", None)),
+        Scenario("POST /predict", lambda i: ("POST", "/predict", to_payload(rows[i % len(rows)]))),
+        Scenario("POST /patients/", lambda i: ("POST", "/patients/", to_payload(rows[i % len(rows)]))),
+        Scenario("POST /patients/batch", lambda i: (
+            "POST", "/patients/batch",
+            [to_payload(rows[(i * batch_size + j) % len(rows)]) for j in range(batch_size)]
+        ), max_requests=50),
+        Scenario("PUT /patients/{id}", lambda i: ("PUT", f"/patients/{created(i)}", to_payload(rows[i % len(rows)]))),
+        Scenario("DELETE /patients/{id}", lambda i: ("DELETE", f"/patients/{created(i)}", None)),
+        Scenario("GET /predictions/run", lambda i: ("GET", "/predictions/run", None)),
+        Scenario("GET /db/pool", lambda i: ("GET", "/db/pool", None)),
+        Scenario("GET /cache/records", lambda i: ("GET", "/cache/records", None)),
+        Scenario("GET /predictions/cache", lambda i: ("GET", "/predictions/cache", None)),
+        Scenario("GET /metrics", lambda i: ("GET", "/metrics", None)),
+    ]
+
+async def drive(client, scenario, concurrency, total, created_ids):
+    """Send `total` requests from `concurrency` concurrent clients."""
+    latencies = []
+    errors = 0
+    indexes = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in indexes:
+            method, url, body = scenario.request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                ok = response.status_code in scenario.expected
+            except Exception:
+                response, ok = None, False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+            elif scenario.name == "POST /patients/":
+                # Write-behind mode answers 202 with a tracking_id; the patient has no id yet
+                patient_id = response.json().get("id")
+                if patient_id is not None:
+                    created_ids.append(patient_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(scenario.name, latencies, errors, time.perf_counter() - start, concurrency=concurrency)
+
+async def bench_api(patients_df, concurrency_levels, requests, base_url, batch_size):
+    import httpx
+
+    results = []
+
+    async def run_all(client):
+        for concurrency in concurrency_levels:
+            created_ids = []
+            for scenario in build_scenarios(patients_df, created_ids, batch_size):
+                total = min(requests, scenario.max_requests or requests)
+                # Writes below use the IDs created by POST /patients/ at this level
+                results.append(await drive(client, scenario, concurrency, total, created_ids))
+                print(f"{scenario.name} @ {concurrency}: "
+                      f"p50 {results[-1]['latency_ms']['p50']:.2f} ms, "
+                      f"{results[-1]['throughput_per_second']:.1f} req/s, "
+                      f"{results[-1]['errors']} errors", file=sys.stderr)
+
+    limits = httpx.Limits(max_connections=max(concurrency_levels))
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await run_all(client)
+    else:
+        # In-process: drive the ASGI app directly, running its lifespan by hand
+        from app.main import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                await run_all(client)
+    return results
+
+def bench_scoring(patients_df, single_predictions, chunk_size, workers):
+    from app.scoring import score_all
+    from benchmarks.synthetic import to_payload
+    import fetch_predict
+
+    results = []
+
+    # fetch_predict.py single-record path: preprocess + unpickle + predict per call
+    rows = patients_df.to_dict("records")
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(single_predictions):
+        call_start = time.perf_counter()
+        try:
+            fetch_predict.predict(fetch_predict.preprocess_data(to_payload(rows[i % len(rows)])))
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - call_start)
+    results.append(summarize("fetch_predict.predict", latencies, errors, time.perf_counter() - start))
+
+    # Whole-table batch scoring
+    start = time.perf_counter()
+    try:
+        summary = score_all(chunk_size, workers)
+        errors, scored = 0, summary["scored"]
+    except Exception as e:
+        print(f"Batch scoring failed: {e}", file=sys.stderr)
+        errors, scored = 1, 0
+    elapsed = time.perf_counter() - start
+    result = summarize("fetch_predict --batch", [elapsed], errors, elapsed, workers=workers)
+    result["rows"] = scored
+    result["rows_per_second"] = scored / elapsed if elapsed else 0.0
+    results.append(result)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the patient API, bulk loader and scoring")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="PostgreSQL URL to seed and benchmark (default: $DATABASE_URL)")
+    parser.add_argument("--reset-schema", action="store_true",
+                        help="recreate the schema from databases/sqlSchema.sql first (drops all data)")
+    parser.add_argument("--patients", type=int, default=10000, help="synthetic patients to seed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="concurrency levels to drive the API at")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and level")
+    parser.add_argument("--batch-size", type=int, default=100, help="patients per POST /patients/batch")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--single-predictions", type=int, default=200,
+                        help="calls of fetch_predict.predict to time")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for batch scoring")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic data")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["load", "api", "scoring"],
+                        help="benchmark groups to skip")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+    configure_database_env(args.database_url)
+    sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.synthetic import load_distributions, generate_patients
+
+    if args.reset_schema:
+        reset_schema()
+
+    patients_df = generate_patients(load_distributions(DATASET), args.patients, args.seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if "load" not in args.skip:
+            results.append(bench_load(patients_df, workdir))
+    if "api" not in args.skip:
+        results += asyncio.run(bench_api(
+            patients_df, args.concurrency, args.requests, args.base_url, args.batch_size
+        ))
+    if "scoring" not in args.skip:
+        results += bench_scoring(patients_df, args.single_predictions, 10000, args.workers)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "patients": args.patients,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "target": args.base_url or "in-process",
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
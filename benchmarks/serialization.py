@@ -0,0 +1,85 @@
+"""Micro-benchmark of the GET / response encodings, without a database.
+
+Encodes pages of synthetic patients the way the endpoint used to (one
+RealDictCursor dict per row, split into nested dicts, jsonable_encoder, then
+json.dumps as in JSONResponse) and the way it does now (plain tuples, nested
+or columnar, encoded by app.serialization), and reports bytes and CPU time
+per patient for each.
+
+    python -m benchmarks.serialization --patients 1000 --repeat 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(REPO_ROOT, "dataset", "data.csv")
+
+def legacy_page(rows, columns, sections, patient_columns):
+    """GET / before the fast path: dict rows, nested by column name, jsonable_encoder, json.dumps."""
+    from fastapi.encoders import jsonable_encoder
+
+    data = []
+    for row in (dict(zip(columns, row)) for row in rows):
+        patient = {"patient": {c: row[c] for c in patient_columns}}
+        for table, table_columns, _, _ in sections:
+            values = {c: row[c] for c in table_columns}
+            patient[table] = values if any(v is not None for v in values.values()) else None
+        data.append(patient)
+    content = jsonable_encoder({"data": data, "next_cursor": None})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def measure(encode, rows, repeat):
+    body = encode(rows)
+    started = time.process_time()
+    for _ in range(repeat):
+        encode(rows)
+    cpu = time.process_time() - started
+    return {
+        "bytes_per_patient": round(len(body) / len(rows), 1),
+        "cpu_us_per_patient": round(cpu / (repeat * len(rows)) * 1e6, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and CPU per patient of the GET / encodings")
+    parser.add_argument("--patients", type=int, default=1000, help="patients per page")
+    parser.add_argument("--repeat", type=int, default=50, help="encodings timed per variant")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic data")
+    args = parser.parse_args()
+    sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.synthetic import load_distributions, generate_patients
+    from app.repository import PATIENT_COLUMNS, PATIENT_ROW_COLUMNS, ROW_SECTIONS, FEATURE_COLUMNS, nest_patient_row
+    from app.serialization import dumps, columnar, orjson
+
+    df = generate_patients(load_distributions(DATASET), args.patients, args.seed)
+    created_at = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    # Shaped like the rows PATIENT_SELECT returns
+    rows = [
+        (serial_id, patient_id, diagnosis, created_at, *features)
+        for serial_id, (patient_id, diagnosis, *features) in enumerate(
+            df[["id", "diagnosis"] + FEATURE_COLUMNS].itertuples(index=False, name=None), start=1
+        )
+    ]
+
+    variants = {
+        "dict_rows+jsonable_encoder+json": lambda rows: legacy_page(rows, PATIENT_ROW_COLUMNS, ROW_SECTIONS, PATIENT_COLUMNS),
+        "tuples+nested": lambda rows: dumps({"data": [nest_patient_row(row) for row in rows], "next_cursor": None}),
+        "tuples+columnar": lambda rows: dumps({**columnar(PATIENT_ROW_COLUMNS, rows), "next_cursor": None}),
+    }
+    results = [{"name": name, **measure(encode, rows, args.repeat)} for name, encode in variants.items()]
+    baseline = results[0]
+    for result in results[1:]:
+        result["bytes_vs_baseline"] = round(result["bytes_per_patient"] / baseline["bytes_per_patient"], 3)
+        result["cpu_vs_baseline"] = round(result["cpu_us_per_patient"] / baseline["cpu_us_per_patient"], 3)
+
+    print(json.dumps({
+        "meta": {"patients": args.patients, "repeat": args.repeat, "encoder": "orjson" if orjson else "json"},
+        "results": results,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from app.model import FEATURE_COLUMNS
+
+# Synthetic IDs start above the 5-6 digit range handed out by next_patient_id()
+FIRST_SYNTHETIC_ID = 9000000
+
+def load_distributions(csv_path):
+    """Per-diagnosis share, feature means and covariance from dataset/data.csv."""
+    df = pd.read_csv(csv_path, skipinitialspace=True)
+    df.columns = df.columns.str.replace(" ", "_")
+    distributions = {}
+    for diagnosis, group in df.groupby("diagnosis"):
+        features = group[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        distributions[diagnosis] = (
+            len(group) / len(df),
+            features.mean(axis=0),
+            np.cov(features, rowvar=False),
+        )
+    return distributions
+
+def generate_patients(distributions, count, seed=0):
+    """Sample `count` patients in the dataset/data.csv column layout."""
+    rng = np.random.default_rng(seed)
+    diagnoses = list(distributions)
+    shares = np.array([distributions[d][0] for d in diagnoses])
+    labels = rng.choice(diagnoses, size=count, p=shares / shares.sum())
+
+    features = np.empty((count, len(FEATURE_COLUMNS)))
+    for diagnosis in diagnoses:
+        mask = labels == diagnosis
+        _, mean, cov = distributions[diagnosis]
+        # The sample covariance is singular with more features than patients, eigh copes with that
+        features[mask] = rng.multivariate_normal(mean, cov, size=mask.sum(), method="eigh", check_valid="ignore")
+    # Tumor measurements are never negative
+    np.clip(features, 0, None, out=features)
+
+    df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    df.insert(0, "diagnosis", labels)
+    df.insert(0, "id", [str(FIRST_SYNTHETIC_ID + i) for i in range(count)])
+    return df
+
+def write_csv(df, path):
+    """Write patients with the same header as dataset/data.csv."""
+    df.rename(columns=lambda c: c.replace("concave_points", "concave points")).to_csv(path, index=False)
+
+def to_payload(row, with_id=False):
+    """API payload (Patient / PatientFeatures) for one generated row."""
+    payload = {
+        f"tumor_{kind}": {c: float(row[c]) for c in FEATURE_COLUMNS if c.endswith("_" + kind)}
+        for kind in ("mean", "se", "worst")
+    }
+    payload["diagnosis"] = row["diagnosis"]
+    if with_id:
+        payload["id"] = row["id"]
+    return payload
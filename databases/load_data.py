@@ -1,4 +1,8 @@
+import argparse
+import hashlib
+import io
 import os
+import time
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
@@ -8,8 +12,28 @@ from urllib.parse import urlparse
 # Load environment variables
 load_dotenv()
 
+# Default input, resolved from this file so the script works from any directory
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset", "data.csv")
+
+# Command line options
+parser = argparse.ArgumentParser(description="Load a patient CSV (default dataset/data.csv) into PostgreSQL")
+parser.add_argument("--input", default=DEFAULT_CSV, metavar="PATH",
+                    help="CSV file to load (default: dataset/data.csv)")
+parser.add_argument("--bulk", action="store_true",
+                    help="stage chunks with COPY and upsert them set-based instead of row by row "
+                         "(the cohort statistics are rebuilt once at the end)")
+parser.add_argument("--sync", action="store_true",
+                    help="only send rows that are new or changed since the last sync, resuming an interrupted run")
+parser.add_argument("--restart", action="store_true",
+                    help="in sync mode, ignore the checkpoint of an interrupted run and start from the first row")
+parser.add_argument("--chunk-size", type=int, default=10000,
+                    help="rows per COPY/commit in bulk and sync mode (default: 10000)")
+parser.add_argument("--rebuild-stats", action="store_true",
+                    help="recompute the cohort statistics behind GET /stats after loading (backfill)")
+args = parser.parse_args()
+
 # Load the dataset
-csv_file = "../dataset/data.csv"
+csv_file = args.input
 df = pd.read_csv(csv_file, skipinitialspace=True)  # Fix column name spacing issues
 
 # Rename columns to replace spaces with underscores
@@ -32,6 +56,238 @@ if not required_columns.issubset(df.columns):
     print(f"Error: Missing columns in dataset: {missing_cols}")
     exit(1)
 
+# Column order used by the staging table in bulk mode
+feature_columns = {
+    table: [
+        f"{name}_{suffix}" for name in (
+            "radius", "texture", "perimeter", "area", "smoothness", "compactness",
+            "concavity", "concave_points", "symmetry", "fractal_dimension"
+        )
+    ]
+    for table, suffix in (("tumor_mean", "mean"), ("tumor_se", "se"), ("tumor_worst", "worst"))
+}
+staging_columns = ["id", "diagnosis"] + [c for cols in feature_columns.values() for c in cols]
+
+# Sync mode: hash every row, diff against patient_row_hashes and upsert only the
+# rows that differ, committing a checkpoint in load_checkpoints with each chunk
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def row_hashes(data):
+    # 64-bit content hash of every column, reinterpreted as signed to fit BIGINT
+    return pd.util.hash_pandas_object(data[staging_columns], index=False).to_numpy().view("int64")
+
+def changed_rows(cursor, data):
+    """Boolean mask of the rows whose hash differs from the stored one (or has none)."""
+    buffer = io.StringIO()
+    cursor.copy_expert("COPY patient_row_hashes (patient_id, row_hash) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    stored = pd.read_csv(buffer, names=["id", "stored_hash"], dtype={"id": str, "stored_hash": "Int64"})
+    merged = data[["id", "row_hash"]].merge(stored, on="id", how="left")
+    return (merged["stored_hash"] != merged["row_hash"]).fillna(True).to_numpy(dtype=bool)
+
+def sync_load(conn, cursor, df, csv_path, chunk_size, restart=False):
+    # Same DDL as sqlSchema.sql, for databases created before sync mode existed
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_row_hashes (
+            patient_id VARCHAR(50) PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+            row_hash BIGINT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS load_checkpoints (
+            source VARCHAR(512) PRIMARY KEY,
+            fingerprint VARCHAR(64) NOT NULL,
+            position INT NOT NULL,
+            total INT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute(f"""
+        CREATE TEMP TABLE staging_sync (
+            id VARCHAR(50), diagnosis VARCHAR(10),
+            {", ".join(f"{c} FLOAT" for c in staging_columns[2:])},
+            row_hash BIGINT
+        ) ON COMMIT DELETE ROWS;
+    """)
+    conn.commit()
+
+    data = df[staging_columns].drop_duplicates(subset="id", keep="last").copy()
+    data["id"] = data["id"].astype(str)
+    data = data.reset_index(drop=True)
+    total = len(data)
+
+    source = os.path.abspath(csv_path)
+    fingerprint = file_fingerprint(csv_path)
+    start = 0
+    cursor.execute("SELECT fingerprint, position FROM load_checkpoints WHERE source = %s", (source,))
+    checkpoint = cursor.fetchone()
+    if checkpoint and checkpoint[0] == fingerprint and not restart:
+        start = checkpoint[1]
+        if start >= total:
+            print(f"{source} is unchanged since the last sync, nothing to do.")
+            return 0, False
+        print(f"Resuming the sync of {source} at row {start + 1} of {total}")
+
+    started = time.perf_counter()
+    data["row_hash"] = row_hashes(data)
+    changed = changed_rows(cursor, data)
+    conn.commit()
+    print(f"{int(changed[start:].sum())} of {total - start} rows are new or changed "
+          f"(diffed in {time.perf_counter() - started:.2f}s)")
+
+    assignments = lambda cols: ", ".join(f"{c} = EXCLUDED.{c}" for c in cols)
+    distinct = lambda table, cols: (
+        f"ROW({', '.join(f'{table}.{c}' for c in cols)}) IS DISTINCT FROM ROW({', '.join(f'EXCLUDED.{c}' for c in cols)})"
+    )
+    upserts = [
+        """
+        INSERT INTO patients (id, diagnosis)
+        SELECT id, diagnosis FROM staging_sync
+        ON CONFLICT (id) DO UPDATE SET diagnosis = EXCLUDED.diagnosis
+        WHERE patients.diagnosis IS DISTINCT FROM EXCLUDED.diagnosis;
+        """
+    ] + [
+        f"""
+        INSERT INTO {table} (patient_id, {", ".join(cols)})
+        SELECT id, {", ".join(cols)} FROM staging_sync
+        ON CONFLICT (patient_id) DO UPDATE SET {assignments(cols)}
+        WHERE {distinct(table, cols)};
+        """
+        for table, cols in feature_columns.items()
+    ] + [
+        """
+        INSERT INTO patient_row_hashes (patient_id, row_hash)
+        SELECT id, row_hash FROM staging_sync
+        ON CONFLICT (patient_id) DO UPDATE SET row_hash = EXCLUDED.row_hash;
+        """
+    ]
+    save_checkpoint = """
+        INSERT INTO load_checkpoints (source, fingerprint, position, total, updated_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (source) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, position = EXCLUDED.position,
+            total = EXCLUDED.total, updated_at = EXCLUDED.updated_at;
+    """
+
+    sent = 0
+    for offset in range(start, total, chunk_size):
+        stop = min(offset + chunk_size, total)
+        chunk = data.iloc[offset:stop][changed[offset:stop]]
+        try:
+            if len(chunk):
+                buffer = io.StringIO()
+                chunk.to_csv(buffer, header=False, index=False)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY staging_sync ({', '.join(staging_columns)}, row_hash) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                for statement in upserts:
+                    cursor.execute(statement)
+            # The checkpoint commits with the rows, so a crash never skips or repeats a chunk
+            cursor.execute(save_checkpoint, (source, fingerprint, stop, total))
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Database error in rows {offset + 1}-{stop}: {e}")
+            print("Run the same command again to resume from this chunk.")
+            return sent, True
+        sent += len(chunk)
+        print(f"Synced rows {offset + 1}-{stop} of {total} ({len(chunk)} sent)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Sync finished: {sent} of {total - start} rows sent in {elapsed:.2f}s")
+    return sent, False
+
+# Bulk mode: COPY each chunk into a temp table, then upsert all four tables set-based.
+# The statistics triggers are skipped for this session; the caller rebuilds them once
+def bulk_load(conn, cursor, df, chunk_size):
+    cursor.execute("SET app.skip_feature_stats = on;")
+    cursor.execute(f"""
+        CREATE TEMP TABLE staging_patients (
+            id VARCHAR(50), diagnosis VARCHAR(10),
+            {", ".join(f"{c} FLOAT" for c in staging_columns[2:])}
+        ) ON COMMIT DELETE ROWS;
+    """)
+    conn.commit()
+
+    upserts = [
+        """
+        INSERT INTO patients (id, diagnosis)
+        SELECT id, diagnosis FROM staging_patients
+        ON CONFLICT (id) DO UPDATE SET diagnosis = EXCLUDED.diagnosis;
+        """
+    ] + [
+        f"""
+        INSERT INTO {table} (patient_id, {", ".join(cols)})
+        SELECT id, {", ".join(cols)} FROM staging_patients
+        ON CONFLICT (patient_id) DO NOTHING;
+        """
+        for table, cols in feature_columns.items()
+    ]
+
+    # ON CONFLICT cannot touch the same row twice in one statement, keep the last occurrence
+    data = df[staging_columns].drop_duplicates(subset="id", keep="last").copy()
+    data["id"] = data["id"].astype(str)
+
+    total = len(data)
+    loaded = 0
+    failed_chunks = []
+    started = time.perf_counter()
+
+    for offset in range(0, total, chunk_size):
+        chunk = data.iloc[offset:offset + chunk_size]
+        chunk_started = time.perf_counter()
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+
+        try:
+            cursor.copy_expert(
+                f"COPY staging_patients ({', '.join(staging_columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            for statement in upserts:
+                cursor.execute(statement)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            failed_chunks.append((offset, offset + len(chunk)))
+            print(f"Database error in rows {offset + 1}-{offset + len(chunk)}, chunk skipped: {e}")
+            continue
+
+        loaded += len(chunk)
+        elapsed = time.perf_counter() - chunk_started
+        print(f"Loaded rows {offset + 1}-{offset + len(chunk)} of {total} "
+              f"({len(chunk) / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Bulk load finished: {loaded} of {total} rows in {elapsed:.2f}s "
+          f"({loaded / max(elapsed, 1e-9):,.0f} rows/s), {len(failed_chunks)} failed chunk(s)")
+    return failed_chunks
+
+# Rebuild the patient_features materialized view served by GET /features
+def refresh_features(conn, cursor):
+    try:
+        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY patient_features;")
+        conn.commit()
+        print("Feature matrix view refreshed.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error refreshing patient_features: {e}")
+
+# Recompute the feature_stats/feature_histograms summary tables served by GET /stats
+def rebuild_stats(conn, cursor):
+    try:
+        cursor.execute("SELECT rebuild_feature_stats();")
+        conn.commit()
+        print("Cohort statistics rebuilt.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error rebuilding cohort statistics: {e}")
+
 # Get DATABASE_URL from .env file
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -80,31 +336,52 @@ try:
 
     insert_tumor_mean = """
     INSERT INTO tumor_mean (
-        id, radius_mean, texture_mean, perimeter_mean, area_mean, 
+        patient_id, radius_mean, texture_mean, perimeter_mean, area_mean, 
         smoothness_mean, compactness_mean, concavity_mean, concave_points_mean, 
         symmetry_mean, fractal_dimension_mean
     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO NOTHING;
+    ON CONFLICT (patient_id) DO NOTHING;
     """
 
     insert_tumor_se = """
     INSERT INTO tumor_se (
-        id, radius_se, texture_se, perimeter_se, area_se, 
+        patient_id, radius_se, texture_se, perimeter_se, area_se, 
         smoothness_se, compactness_se, concavity_se, concave_points_se, 
         symmetry_se, fractal_dimension_se
     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO NOTHING;
+    ON CONFLICT (patient_id) DO NOTHING;
     """
 
     insert_tumor_worst = """
     INSERT INTO tumor_worst (
-        id, radius_worst, texture_worst, perimeter_worst, area_worst, 
+        patient_id, radius_worst, texture_worst, perimeter_worst, area_worst, 
         smoothness_worst, compactness_worst, concavity_worst, concave_points_worst, 
         symmetry_worst, fractal_dimension_worst
     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO NOTHING;
+    ON CONFLICT (patient_id) DO NOTHING;
     """
 
+    if args.sync:
+        sent, failed = sync_load(conn, cursor, df, csv_file, args.chunk_size, args.restart)
+        if sent:
+            refresh_features(conn, cursor)
+        if args.rebuild_stats:
+            rebuild_stats(conn, cursor)
+        if failed:
+            exit(1)
+        print("Database is in sync with the input file.")
+        exit(0)
+
+    if args.bulk:
+        failed_chunks = bulk_load(conn, cursor, df, args.chunk_size)
+        refresh_features(conn, cursor)
+        # Always: the bulk upserts skipped the statistics triggers
+        rebuild_stats(conn, cursor)
+        if failed_chunks:
+            exit(1)
+        print("Data successfully inserted into Database.")
+        exit(0)
+
     # Insert data into PostgreSQL
     for index, row in df.iterrows():
         patient_id = str(row["id"])  # Convert to string for consistency
@@ -145,6 +422,9 @@ try:
             conn.rollback()  # Rollback on error
             print(f"Database error inserting row {index + 1} (ID: {patient_id}): {e}")
 
+    refresh_features(conn, cursor)
+    if args.rebuild_stats:
+        rebuild_stats(conn, cursor)
     print("Data successfully inserted into Database.")
 except psycopg2.Error as e:
     print(f"Error connecting to PostgreSQL: {e}")
@@ -0,0 +1,66 @@
+-- Migrate a database created with an earlier sqlSchema.sql, where tumor rows were
+-- linked to their patient through tumor_*.id and tumor_*.patient_id was NULL, to
+-- the current layout (tumor rows keyed by an indexed patient_id), creating any
+-- other object the current schema has. Keeps all data and is safe to run more
+-- than once:
+--   psql "$DATABASE_URL" -f databases/migrate_tumor_patient_id.sql
+BEGIN;
+
+-- The statistics triggers would count every row touched below; the statistics
+-- are rebuilt at the end instead
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_insert ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_update ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_delete ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_mean_diagnosis ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_insert ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_update ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_delete ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_se_diagnosis ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_insert ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_update ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_delete ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_diagnosis ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_patient_stats_diagnosis ON patients;
+DROP TRIGGER IF EXISTS trigger_patient_stats_delete ON patients;
+DROP MATERIALIZED VIEW IF EXISTS patient_features;
+
+-- Per tumor table: drop rows whose id matches no patient, move the link into
+-- patient_id, keep the newest row per patient, fill the diagnosis copy, and move
+-- the id sequence past the patient IDs that were stored in it
+ALTER TABLE tumor_mean ADD COLUMN IF NOT EXISTS diagnosis VARCHAR(10);
+DELETE FROM tumor_mean t WHERE t.patient_id IS NULL AND NOT EXISTS (SELECT 1 FROM patients p WHERE p.id = t.id::TEXT);
+UPDATE tumor_mean SET patient_id = id::TEXT WHERE patient_id IS NULL;
+DELETE FROM tumor_mean a USING tumor_mean b WHERE a.patient_id = b.patient_id AND a.id < b.id;
+ALTER TABLE tumor_mean ALTER COLUMN patient_id SET NOT NULL;
+UPDATE tumor_mean t SET diagnosis = p.diagnosis FROM patients p WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+SELECT setval(pg_get_serial_sequence('tumor_mean', 'id'), GREATEST((SELECT MAX(id) FROM tumor_mean), 1));
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_mean_patient_id_idx ON tumor_mean (patient_id);
+
+ALTER TABLE tumor_se ADD COLUMN IF NOT EXISTS diagnosis VARCHAR(10);
+DELETE FROM tumor_se t WHERE t.patient_id IS NULL AND NOT EXISTS (SELECT 1 FROM patients p WHERE p.id = t.id::TEXT);
+UPDATE tumor_se SET patient_id = id::TEXT WHERE patient_id IS NULL;
+DELETE FROM tumor_se a USING tumor_se b WHERE a.patient_id = b.patient_id AND a.id < b.id;
+ALTER TABLE tumor_se ALTER COLUMN patient_id SET NOT NULL;
+UPDATE tumor_se t SET diagnosis = p.diagnosis FROM patients p WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+SELECT setval(pg_get_serial_sequence('tumor_se', 'id'), GREATEST((SELECT MAX(id) FROM tumor_se), 1));
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_se_patient_id_idx ON tumor_se (patient_id);
+
+ALTER TABLE tumor_worst ADD COLUMN IF NOT EXISTS diagnosis VARCHAR(10);
+DELETE FROM tumor_worst t WHERE t.patient_id IS NULL AND NOT EXISTS (SELECT 1 FROM patients p WHERE p.id = t.id::TEXT);
+UPDATE tumor_worst SET patient_id = id::TEXT WHERE patient_id IS NULL;
+DELETE FROM tumor_worst a USING tumor_worst b WHERE a.patient_id = b.patient_id AND a.id < b.id;
+ALTER TABLE tumor_worst ALTER COLUMN patient_id SET NOT NULL;
+UPDATE tumor_worst t SET diagnosis = p.diagnosis FROM patients p WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+SELECT setval(pg_get_serial_sequence('tumor_worst', 'id'), GREATEST((SELECT MAX(id) FROM tumor_worst), 1));
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_worst_patient_id_idx ON tumor_worst (patient_id);
+
+-- Everything the current schema has on top of the tables: the sequence and
+-- next_patient_id(), the statistics, prediction, sync and log tables, functions,
+-- triggers and the feature matrix view (schema_objects.sql skips what exists)
+\ir schema_objects.sql
+
+SELECT rebuild_feature_stats();
+COMMIT;
@@ -0,0 +1,408 @@
+-- Indexes, functions, triggers, views and supporting tables of the patient
+-- schema, on top of the patients and tumor_* tables. Every statement can be
+-- re-run, so both sqlSchema.sql and migrate_tumor_patient_id.sql include this
+-- file (psql \ir; app.repository.read_schema() expands it for other clients).
+
+-- Patient ID Allocation: 5-6 digit IDs handed out by a sequence
+CREATE SEQUENCE IF NOT EXISTS patient_id_seq MINVALUE 10000 MAXVALUE 999999 START WITH 10000;
+
+-- Create Function to Allocate the Next Free Patient ID
+CREATE OR REPLACE FUNCTION next_patient_id() RETURNS VARCHAR(50) AS $$
+DECLARE
+    candidate VARCHAR(50);
+BEGIN
+    LOOP
+        candidate := nextval('patient_id_seq')::TEXT;
+        -- Sequence values are never handed out twice, so a value already used
+        -- by an explicitly supplied ID is skipped once and never retried
+        IF NOT EXISTS (SELECT 1 FROM patients WHERE id = candidate) THEN
+            RETURN candidate;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Indexes for the API's access paths. Tumor rows are looked up, joined, upserted
+-- and cascade-deleted by patient_id; each patient has at most one row per table
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_mean_patient_id_idx ON tumor_mean (patient_id);
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_se_patient_id_idx ON tumor_se (patient_id);
+CREATE UNIQUE INDEX IF NOT EXISTS tumor_worst_patient_id_idx ON tumor_worst (patient_id);
+
+-- GET /patients/last (ORDER BY serial_id DESC LIMIT 1) as an index-only scan
+CREATE INDEX IF NOT EXISTS patients_serial_id_covering_idx ON patients (serial_id) INCLUDE (id, diagnosis, created_at);
+
+-- Create Predictions Table (batch scores per patient and model version)
+CREATE TABLE IF NOT EXISTS predictions (
+    patient_id VARCHAR(50) REFERENCES patients(id) ON DELETE CASCADE,
+    model_version VARCHAR(64) NOT NULL,
+    prediction SMALLINT NOT NULL, -- 1 for Malignant, 0 for Benign
+    probability_malignant FLOAT NOT NULL,
+    scored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (patient_id, model_version)
+);
+
+-- Create Row Hash Table: content hash of each patient's last synced CSV row, so
+-- load_data.py --sync only sends rows that are new or changed
+CREATE TABLE IF NOT EXISTS patient_row_hashes (
+    patient_id VARCHAR(50) PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+    row_hash BIGINT NOT NULL
+);
+
+-- Create Load Checkpoints Table: how far load_data.py --sync got through an input
+-- file, committed with each chunk so an interrupted sync resumes there
+CREATE TABLE IF NOT EXISTS load_checkpoints (
+    source VARCHAR(512) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    position INT NOT NULL,
+    total INT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create Feature Matrix View: one wide row per patient with the 30 model features.
+-- Refresh on demand with
+-- REFRESH MATERIALIZED VIEW CONCURRENTLY patient_features (POST /features/refresh).
+CREATE MATERIALIZED VIEW IF NOT EXISTS patient_features AS
+SELECT
+    p.serial_id, p.id,
+    CASE WHEN p.diagnosis = 'M' THEN 1 ELSE 0 END AS malignant,
+    m.radius_mean, m.texture_mean, m.perimeter_mean, m.area_mean, m.smoothness_mean,
+    m.compactness_mean, m.concavity_mean, m.concave_points_mean, m.symmetry_mean, m.fractal_dimension_mean,
+    s.radius_se, s.texture_se, s.perimeter_se, s.area_se, s.smoothness_se,
+    s.compactness_se, s.concavity_se, s.concave_points_se, s.symmetry_se, s.fractal_dimension_se,
+    w.radius_worst, w.texture_worst, w.perimeter_worst, w.area_worst, w.smoothness_worst,
+    w.compactness_worst, w.concavity_worst, w.concave_points_worst, w.symmetry_worst, w.fractal_dimension_worst
+FROM patients p
+JOIN tumor_mean m ON m.patient_id = p.id
+JOIN tumor_se s ON s.patient_id = p.id
+JOIN tumor_worst w ON w.patient_id = p.id;
+
+-- Unique index required by REFRESH ... CONCURRENTLY, also the export order
+CREATE UNIQUE INDEX IF NOT EXISTS patient_features_serial_id_idx ON patient_features (serial_id);
+
+-- Create Patient Changes Log Table
+CREATE TABLE IF NOT EXISTS patient_changes_log (
+    log_id SERIAL PRIMARY KEY,
+    patient_id VARCHAR(50) REFERENCES patients(id) ON DELETE CASCADE,
+    old_diagnosis VARCHAR(10),
+    new_diagnosis VARCHAR(10),
+    change_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Foreign key index, so deleting a patient does not scan the whole log
+CREATE INDEX IF NOT EXISTS patient_changes_log_patient_id_idx ON patient_changes_log (patient_id);
+
+-- Create Function to Log Diagnosis Changes
+CREATE OR REPLACE FUNCTION log_diagnosis_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.diagnosis IS DISTINCT FROM NEW.diagnosis THEN
+        INSERT INTO patient_changes_log (patient_id, old_diagnosis, new_diagnosis)
+        VALUES (OLD.id, OLD.diagnosis, NEW.diagnosis);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create Trigger to Log Diagnosis Changes (only fires when the diagnosis actually changes)
+DROP TRIGGER IF EXISTS trigger_log_diagnosis_change ON patients;
+CREATE TRIGGER trigger_log_diagnosis_change
+BEFORE UPDATE OF diagnosis ON patients
+FOR EACH ROW
+WHEN (OLD.diagnosis IS DISTINCT FROM NEW.diagnosis)
+EXECUTE FUNCTION log_diagnosis_change();
+
+-- Create Cohort Statistics Tables: running count, sum and sum of squares per
+-- diagnosis and feature, so GET /stats reads a fixed number of rows however many
+-- patients there are (mean = total / n, variance = (total_sq - total^2 / n) / (n - 1))
+CREATE TABLE IF NOT EXISTS feature_stats (
+    diagnosis VARCHAR(10) NOT NULL,
+    feature VARCHAR(64) NOT NULL,
+    n BIGINT NOT NULL DEFAULT 0,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (diagnosis, feature)
+);
+
+-- Fixed-width histogram buckets per feature. Bucket 0 counts values below `low` and
+-- bucket `buckets + 1` values at or above `high` (the width_bucket() convention)
+CREATE TABLE IF NOT EXISTS histogram_bins (
+    feature VARCHAR(64) PRIMARY KEY,
+    low DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    buckets INT NOT NULL
+);
+
+INSERT INTO histogram_bins (feature, low, high, buckets) VALUES ('radius_mean', 5, 30, 25)
+ON CONFLICT (feature) DO NOTHING;
+INSERT INTO histogram_bins (feature, low, high, buckets) VALUES ('area_worst', 0, 4500, 45)
+ON CONFLICT (feature) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS feature_histograms (
+    diagnosis VARCHAR(10) NOT NULL,
+    feature VARCHAR(64) NOT NULL,
+    bucket INT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (diagnosis, feature, bucket)
+);
+
+-- Create Statistics Deltas Table: changes to feature_stats (bucket NULL) and
+-- feature_histograms written by open transactions. Each transaction's rows are
+-- folded into the summary tables when it commits, see fold_feature_deltas(), so
+-- at commit the table is empty again and never needs to be logged
+CREATE UNLOGGED TABLE IF NOT EXISTS feature_stats_deltas (
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    diagnosis VARCHAR(10) NOT NULL,
+    feature VARCHAR(64) NOT NULL,
+    bucket INT,
+    n BIGINT NOT NULL,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total_sq DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS feature_stats_deltas_txid_idx ON feature_stats_deltas (txid);
+
+-- Statistics used to be applied one row at a time by apply_feature_stats()
+DROP FUNCTION IF EXISTS apply_feature_stats(VARCHAR, JSONB, INT);
+
+-- Create Function to Fold the Transaction's Deltas into the Statistics. This is
+-- the only writer of the summary rows besides rebuild_feature_stats(): it runs
+-- once per transaction, at commit, and locks the rows in key order, so writers
+-- hold the hot per-diagnosis rows only while committing and cannot deadlock on
+-- them. It fires for every delta row; the first firing folds them all
+CREATE OR REPLACE FUNCTION fold_feature_deltas() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM 1 FROM feature_stats_deltas WHERE txid = txid_current() LIMIT 1;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO feature_stats AS s (diagnosis, feature, n, total, total_sq)
+    SELECT diagnosis, feature, SUM(n), SUM(total), SUM(total_sq)
+    FROM feature_stats_deltas
+    WHERE txid = txid_current() AND bucket IS NULL
+    GROUP BY diagnosis, feature
+    ORDER BY diagnosis, feature
+    ON CONFLICT (diagnosis, feature) DO UPDATE
+    SET n = s.n + EXCLUDED.n, total = s.total + EXCLUDED.total, total_sq = s.total_sq + EXCLUDED.total_sq;
+
+    INSERT INTO feature_histograms AS h (diagnosis, feature, bucket, count)
+    SELECT diagnosis, feature, bucket, SUM(n)
+    FROM feature_stats_deltas
+    WHERE txid = txid_current() AND bucket IS NOT NULL
+    GROUP BY diagnosis, feature, bucket
+    ORDER BY diagnosis, feature, bucket
+    ON CONFLICT (diagnosis, feature, bucket) DO UPDATE SET count = h.count + EXCLUDED.count;
+
+    DELETE FROM feature_stats_deltas WHERE txid = txid_current();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_fold_feature_deltas ON feature_stats_deltas;
+CREATE CONSTRAINT TRIGGER trigger_fold_feature_deltas
+AFTER INSERT ON feature_stats_deltas
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fold_feature_deltas();
+
+-- Create Function to Copy the Patient's Diagnosis onto a New Tumor Row
+CREATE OR REPLACE FUNCTION set_tumor_diagnosis() RETURNS TRIGGER AS $$
+BEGIN
+    SELECT diagnosis INTO NEW.diagnosis FROM patients WHERE id = NEW.patient_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_tumor_mean_diagnosis ON tumor_mean;
+CREATE TRIGGER trigger_tumor_mean_diagnosis BEFORE INSERT OR UPDATE OF patient_id ON tumor_mean
+FOR EACH ROW EXECUTE FUNCTION set_tumor_diagnosis();
+DROP TRIGGER IF EXISTS trigger_tumor_se_diagnosis ON tumor_se;
+CREATE TRIGGER trigger_tumor_se_diagnosis BEFORE INSERT OR UPDATE OF patient_id ON tumor_se
+FOR EACH ROW EXECUTE FUNCTION set_tumor_diagnosis();
+DROP TRIGGER IF EXISTS trigger_tumor_worst_diagnosis ON tumor_worst;
+CREATE TRIGGER trigger_tumor_worst_diagnosis BEFORE INSERT OR UPDATE OF patient_id ON tumor_worst
+FOR EACH ROW EXECUTE FUNCTION set_tumor_diagnosis();
+
+-- Create Function to Keep the Statistics Current as Tumor Rows Change. It runs
+-- once per statement over the transition tables. Every changed row is counted
+-- under its own diagnosis column, -1 for the old version and +1 for the new one,
+-- so a statement that changes both the diagnosis and the tumor values (the update
+-- CTE in app/repository.py) is accounted from one consistent OLD/NEW pair. The
+-- deltas are summed per (diagnosis, feature) and queued in feature_stats_deltas
+-- for fold_feature_deltas(); features whose values did not change net out
+CREATE OR REPLACE FUNCTION update_tumor_stats() RETURNS TRIGGER AS $$
+DECLARE
+    changed TEXT;
+BEGIN
+    -- Bulk loads (load_data.py --bulk) set this for their session and rebuild the
+    -- statistics once at the end instead
+    IF current_setting('app.skip_feature_stats', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    changed := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, to_jsonb(r) AS tumor FROM new_rows r'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, to_jsonb(r) AS tumor FROM old_rows r'
+        ELSE 'SELECT -1 AS sign, to_jsonb(r) AS tumor FROM old_rows r UNION ALL SELECT 1, to_jsonb(r) FROM new_rows r'
+    END;
+
+    EXECUTE format($sql$
+        WITH changed AS (
+            SELECT c.tumor->>'diagnosis' AS diagnosis, f.key AS feature, c.sign, f.value::FLOAT8 AS value
+            FROM (%s) c, jsonb_each_text(c.tumor - 'id' - 'patient_id' - 'diagnosis' - 'created_at') f
+            WHERE c.tumor->>'diagnosis' IS NOT NULL AND f.value IS NOT NULL
+        )
+        INSERT INTO feature_stats_deltas (diagnosis, feature, bucket, n, total, total_sq)
+        SELECT diagnosis, feature, NULL, SUM(sign), SUM(sign * value), SUM(sign * value * value)
+        FROM changed
+        GROUP BY diagnosis, feature
+        HAVING SUM(sign) <> 0 OR SUM(sign * value) <> 0 OR SUM(sign * value * value) <> 0
+        UNION ALL
+        SELECT c.diagnosis, c.feature, width_bucket(c.value, b.low, b.high, b.buckets), SUM(c.sign), 0, 0
+        FROM changed c
+        JOIN histogram_bins b ON b.feature = c.feature
+        GROUP BY 1, 2, 3
+        HAVING SUM(c.sign) <> 0
+    $sql$, changed);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables need one trigger per event (the row-level trigger_*_stats came before)
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats ON tumor_mean;
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats ON tumor_se;
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats ON tumor_worst;
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_insert ON tumor_mean;
+CREATE TRIGGER trigger_tumor_mean_stats_insert AFTER INSERT ON tumor_mean
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_update ON tumor_mean;
+CREATE TRIGGER trigger_tumor_mean_stats_update AFTER UPDATE ON tumor_mean
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_mean_stats_delete ON tumor_mean;
+CREATE TRIGGER trigger_tumor_mean_stats_delete AFTER DELETE ON tumor_mean
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_insert ON tumor_se;
+CREATE TRIGGER trigger_tumor_se_stats_insert AFTER INSERT ON tumor_se
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_update ON tumor_se;
+CREATE TRIGGER trigger_tumor_se_stats_update AFTER UPDATE ON tumor_se
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_se_stats_delete ON tumor_se;
+CREATE TRIGGER trigger_tumor_se_stats_delete AFTER DELETE ON tumor_se
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_insert ON tumor_worst;
+CREATE TRIGGER trigger_tumor_worst_stats_insert AFTER INSERT ON tumor_worst
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_update ON tumor_worst;
+CREATE TRIGGER trigger_tumor_worst_stats_update AFTER UPDATE ON tumor_worst
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+DROP TRIGGER IF EXISTS trigger_tumor_worst_stats_delete ON tumor_worst;
+CREATE TRIGGER trigger_tumor_worst_stats_delete AFTER DELETE ON tumor_worst
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_tumor_stats();
+
+-- Create Function to Move a Patient's Tumor Rows to a New Diagnosis. It runs
+-- AFTER the statement, so the tumor rows it updates already hold any values the
+-- same statement wrote, and update_tumor_stats() moves exactly those. Deleted
+-- patients need nothing here: ON DELETE CASCADE fires update_tumor_stats()
+CREATE OR REPLACE FUNCTION update_patient_stats() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE tumor_mean SET diagnosis = NEW.diagnosis WHERE patient_id = NEW.id;
+    UPDATE tumor_se SET diagnosis = NEW.diagnosis WHERE patient_id = NEW.id;
+    UPDATE tumor_worst SET diagnosis = NEW.diagnosis WHERE patient_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_patient_stats_diagnosis ON patients;
+CREATE TRIGGER trigger_patient_stats_diagnosis
+AFTER UPDATE OF diagnosis ON patients
+FOR EACH ROW
+WHEN (OLD.diagnosis IS DISTINCT FROM NEW.diagnosis)
+EXECUTE FUNCTION update_patient_stats();
+
+-- Create Function to Recompute the Statistics from Scratch (backfill after loading
+-- data with the triggers disabled, or to repair drift). Writers that touch the
+-- statistics wait until it commits.
+CREATE OR REPLACE FUNCTION rebuild_feature_stats() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE feature_stats, feature_histograms IN EXCLUSIVE MODE;
+    -- Resync the diagnosis copies first; the statistics they touch are recomputed below
+    UPDATE tumor_mean t SET diagnosis = p.diagnosis FROM patients p
+    WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+    UPDATE tumor_se t SET diagnosis = p.diagnosis FROM patients p
+    WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+    UPDATE tumor_worst t SET diagnosis = p.diagnosis FROM patients p
+    WHERE p.id = t.patient_id AND t.diagnosis IS DISTINCT FROM p.diagnosis;
+    DELETE FROM feature_stats;
+    DELETE FROM feature_histograms;
+
+    CREATE TEMPORARY TABLE feature_values AS
+    SELECT p.diagnosis, f.key AS feature, f.value::FLOAT8 AS value
+    FROM patients p
+    JOIN (
+        SELECT patient_id, to_jsonb(t) AS tumor FROM tumor_mean t
+        UNION ALL SELECT patient_id, to_jsonb(t) FROM tumor_se t
+        UNION ALL SELECT patient_id, to_jsonb(t) FROM tumor_worst t
+    ) t ON t.patient_id = p.id,
+    jsonb_each_text(t.tumor - 'id' - 'patient_id' - 'diagnosis' - 'created_at') f
+    WHERE f.value IS NOT NULL;
+
+    INSERT INTO feature_stats (diagnosis, feature, n, total, total_sq)
+    SELECT diagnosis, feature, COUNT(*), SUM(value), SUM(value * value)
+    FROM feature_values
+    GROUP BY diagnosis, feature;
+
+    INSERT INTO feature_histograms (diagnosis, feature, bucket, count)
+    SELECT v.diagnosis, v.feature, width_bucket(v.value, b.low, b.high, b.buckets), COUNT(*)
+    FROM feature_values v
+    JOIN histogram_bins b ON b.feature = v.feature
+    GROUP BY 1, 2, 3;
+
+    DROP TABLE feature_values;
+    -- The resync above queued deltas that the recomputed statistics already include
+    DELETE FROM feature_stats_deltas WHERE txid = txid_current();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create Function to Announce New Patients on the patient_inserts Channel
+-- (delivered on commit, so listeners can already read the tumor rows)
+CREATE OR REPLACE FUNCTION notify_patient_insert() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('patient_inserts', json_build_object(
+        'id', NEW.id, 'serial_id', NEW.serial_id, 'diagnosis', NEW.diagnosis
+    )::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create Trigger to Notify Listeners of New Patients
+DROP TRIGGER IF EXISTS trigger_notify_patient_insert ON patients;
+CREATE TRIGGER trigger_notify_patient_insert
+AFTER INSERT ON patients
+FOR EACH ROW
+EXECUTE FUNCTION notify_patient_insert();
+
+-- Stored Procedure for Inserting or Updating Patients
+DROP PROCEDURE IF EXISTS InsertOrUpdatePatient;
+
+CREATE OR REPLACE PROCEDURE InsertOrUpdatePatient(
+    p_id VARCHAR(50),
+    p_diagnosis VARCHAR(10),
+    OUT p_serial_id INT
+)
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Insert or update the patient record
+    INSERT INTO patients (id, diagnosis)
+    VALUES (p_id, p_diagnosis)
+    ON CONFLICT (id) DO UPDATE SET diagnosis = EXCLUDED.diagnosis
+    RETURNING serial_id INTO p_serial_id;
+END;
+$$;
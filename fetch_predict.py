@@ -1,12 +1,18 @@
+import argparse
+import json
+import time
+from collections import OrderedDict
 import requests
 import pickle
+import numpy as np
 import pandas as pd
 
 # API URL for fetching the latest patient entry
-API_URL = "https://ml-formative-database.onrender.com/patients/last"
+API_BASE = "https://ml-formative-database.onrender.com"
+API_URL = f"{API_BASE}/patients/last"
 
 # Path to the saved model
-MODEL_PATH = "./saved_best_model/logistic_regression.pkl"
+MODEL_PATH = "./saved_best_model/Logistic_regression.pkl"
 
 # Fetch the latest patient data from the API
 def fetch_latest_patient():
@@ -71,16 +77,121 @@ def preprocess_data(patient_data):
     return df.to_numpy()
 
 # Load the trained model and make a prediction
-def predict(data):
+def predict(data, model=None):
     try:
-        with open(MODEL_PATH, "rb") as model_file:
-            model = pickle.load(model_file)
+        if model is None:
+            with open(MODEL_PATH, "rb") as model_file:
+                model = pickle.load(model_file)
         prediction = model.predict(data)
         return "Malignant" if prediction[0] == 1 else "Benign"
     except Exception as e:
         raise Exception(f"Error loading or predicting with the model: {e}")
 
+# Download the /features matrix to `path` and memory-map it. Returns views of
+# the serial_id column, the malignant labels and the (patients, 30) features.
+def load_feature_matrix(api_base, path="patient_features.npy"):
+    with requests.get(f"{api_base}/features", stream=True) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    matrix = np.load(path, mmap_mode="r")
+    return matrix[:, 0], matrix[:, 1], matrix[:, 2:]
+
+# Yield each Server-Sent Event from a streaming response as (id, data)
+def read_events(response):
+    event_id, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event_id, json.loads("\n".join(data))
+            event_id, data = None, []
+        elif line.startswith("id:"):
+            event_id = line[3:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+# Score every new patient as it is inserted, using the /patients/events stream.
+# After a dropped connection it resumes from the last event it saw.
+def subscribe(api_base, after=None):
+    with open(MODEL_PATH, "rb") as model_file:
+        model = pickle.load(model_file)
+
+    last_event_id = str(after) if after is not None else None
+    # The stream repeats a window of recent patients on reconnect; score each once
+    scored = OrderedDict()
+    while True:
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id:
+            headers["Last-Event-ID"] = last_event_id
+        try:
+            with requests.get(f"{api_base}/patients/events", headers=headers, stream=True, timeout=(10, 60)) as response:
+                response.raise_for_status()
+                print("Subscribed to new patients...")
+                for event_id, event in read_events(response):
+                    # Events can arrive out of serial_id order; resume after the highest seen
+                    if event_id and (last_event_id is None or int(event_id) > int(last_event_id)):
+                        last_event_id = event_id
+                    if event["id"] in scored:
+                        continue
+                    scored[event["id"]] = None
+                    if len(scored) > 10000:
+                        scored.popitem(last=False)
+                    patient_response = requests.get(f"{api_base}/patients/{event['id']}")
+                    if patient_response.status_code == 200:
+                        result = predict(preprocess_data(patient_response.json()), model)
+                        print(f"Patient {event['id']}: Predicted Diagnosis: {result}")
+                    else:
+                        print(f"Patient {event['id']}: error fetching data: {patient_response.status_code}")
+        except requests.RequestException as e:
+            print(f"Stream error: {e}")
+        print("Reconnecting...")
+        time.sleep(2)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict breast cancer diagnosis")
+    parser.add_argument("--batch", action="store_true",
+                        help="score every patient in the database and store the results in predictions")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="patients scored per chunk in batch mode (default: 10000)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for large tables in batch mode (default: 1)")
+    parser.add_argument("--subscribe", action="store_true",
+                        help="score each new patient as it is inserted instead of polling the last one")
+    parser.add_argument("--after", type=int,
+                        help="in subscribe mode, first score patients with a serial_id above this one")
+    parser.add_argument("--features", metavar="PATH",
+                        help="download the feature matrix to PATH and score every patient in it locally")
+    parser.add_argument("--api-base", default=API_BASE, help=f"API used by --subscribe and --features (default: {API_BASE})")
+    args = parser.parse_args()
+
+    if args.features:
+        serial_ids, labels, features = load_feature_matrix(args.api_base, args.features)
+        with open(MODEL_PATH, "rb") as model_file:
+            model = pickle.load(model_file)
+        predictions = model.predict(features)
+        print(f"Scored {len(predictions)} patients: {int(np.sum(predictions == 1))} predicted malignant, "
+              f"{float(np.mean(predictions == labels)) if len(labels) else 0.0:.3f} agreement with stored diagnoses")
+        raise SystemExit(0)
+
+    if args.subscribe:
+        try:
+            subscribe(args.api_base, args.after)
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit(0)
+
+    if args.batch:
+        from app.scoring import score_all
+
+        print("Scoring all patients...")
+        summary = score_all(args.chunk_size, args.workers)
+        print(f"Scored {summary['scored']} patients with model {summary['model_version']} "
+              f"in {summary['seconds']}s ({summary['rows_per_second']} rows/s, {summary['workers']} worker(s))")
+        raise SystemExit(0)
+
     try:
         print("Fetching latest patient data...")
         patient_data = fetch_latest_patient()
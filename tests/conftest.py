@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# The API tests run on the embedded SQLite backend; set before app modules are imported
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Scratch PostgreSQL database for the query tests; the schema is recreated, so all its data is dropped
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture
+def pg_cursor():
+    """Autocommit cursor on a freshly created schema (skips without TEST_DATABASE_URL)."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    from app.repository import read_schema
+
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(read_schema())
+            yield cursor
+    finally:
+        conn.close()
@@ -0,0 +1,54 @@
+"""databases/migrate_tumor_patient_id.sql on a database created with the original schema (TEST_DATABASE_URL)."""
+import os
+import pytest
+from app.repository import CREATE_PATIENT, FEATURE_COLUMNS, TUMOR_TABLES, read_schema
+
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "databases",
+                              "migrate_tumor_patient_id.sql")
+
+# The tables of the first sqlSchema.sql: tumor rows share the patient's numeric ID
+# as their own id and leave patient_id NULL. Tumor row 99 has no patient
+ORIGINAL_SCHEMA = """
+    DROP SCHEMA public CASCADE;
+    CREATE SCHEMA public;
+    CREATE TABLE patients (
+        serial_id SERIAL PRIMARY KEY, id VARCHAR(50) UNIQUE NOT NULL, diagnosis VARCHAR(10) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE patient_changes_log (
+        log_id SERIAL PRIMARY KEY, patient_id VARCHAR(50) REFERENCES patients(id) ON DELETE CASCADE,
+        old_diagnosis VARCHAR(10), new_diagnosis VARCHAR(10), change_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO patients (id, diagnosis) VALUES ('1', 'M'), ('2', 'B');
+""" + "".join(f"""
+    CREATE TABLE {table} (
+        id SERIAL PRIMARY KEY, patient_id VARCHAR(50) REFERENCES patients(id) ON DELETE CASCADE,
+        {", ".join(f"{c} FLOAT" for c in columns)}, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO {table} (id, {columns[0]}) VALUES (1, 10), (2, 20), (99, 5);
+""" for table, columns in TUMOR_TABLES.items())
+
+@pytest.fixture
+def original_cursor(pg_cursor):
+    pg_cursor.execute(ORIGINAL_SCHEMA)
+    return pg_cursor
+
+def test_migrate_original_schema(original_cursor):
+    cursor = original_cursor
+    # Safe to run more than once
+    for _ in range(2):
+        cursor.execute(read_schema(MIGRATION_PATH))
+
+    # Orphaned tumor rows are dropped, the others are keyed by patient_id
+    cursor.execute("SELECT patient_id, radius_mean, diagnosis FROM tumor_mean ORDER BY patient_id")
+    assert cursor.fetchall() == [("1", 10.0, "M"), ("2", 20.0, "B")]
+    cursor.execute("SELECT diagnosis, n, total FROM feature_stats WHERE feature = 'radius_mean' ORDER BY diagnosis")
+    assert cursor.fetchall() == [("B", 1, 20.0), ("M", 1, 10.0)]
+
+    # The objects the API needs exist afterwards
+    cursor.execute(CREATE_PATIENT, (None, "M", *[1.0] * len(FEATURE_COLUMNS)))
+    cursor.execute("SELECT n FROM feature_stats WHERE diagnosis = 'M' AND feature = 'radius_mean'")
+    assert cursor.fetchone() == (2,)
+    cursor.execute("REFRESH MATERIALIZED VIEW patient_features")
+    cursor.execute("SELECT id FROM patient_features ORDER BY serial_id")
+    assert [row[0] for row in cursor.fetchall()] == ["1", "2", "10000"]
@@ -0,0 +1,36 @@
+"""GET /patients/{id}/predict with missing features, on the SQLite backend."""
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.repository import TUMOR_TABLES, repository
+
+def patient_payload(patient_id):
+    return {
+        "id": patient_id,
+        "diagnosis": "M",
+        **{table: {c: 1.0 for c in columns} for table, columns in TUMOR_TABLES.items()},
+    }
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+def test_patient_without_tumor_se(client):
+    assert client.post("/patients", json=patient_payload("no-se")).status_code == 200
+    repository._execute("DELETE FROM tumor_se WHERE patient_id = %s", ("no-se",))
+
+    response = client.get("/patients/no-se/predict")
+    assert response.status_code == 200
+    assert response.json()["prediction"] in ("Malignant", "Benign")
+
+def test_patient_with_null_feature(client):
+    assert client.post("/patients", json=patient_payload("null-radius")).status_code == 200
+    repository._execute("UPDATE tumor_mean SET radius_mean = NULL WHERE patient_id = %s", ("null-radius",))
+
+    response = client.get("/patients/null-radius/predict")
+    assert response.status_code == 200
+    assert 0.0 <= response.json()["probability_malignant"] <= 1.0
+
+def test_unknown_patient(client):
+    assert client.get("/patients/does-not-exist/predict").status_code == 404
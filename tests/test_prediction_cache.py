@@ -0,0 +1,32 @@
+from app.cache import PredictionCache
+
+def test_invalidate_drops_every_model_version():
+    cache = PredictionCache(10)
+    cache.put(("p1", "v1"), 1)
+    cache.put(("p1", "v2"), 2)
+    cache.put(("p2", "v1"), 3)
+    cache.invalidate("p1")
+    assert cache.get(("p1", "v1")) is None
+    assert cache.get(("p1", "v2")) is None
+    assert cache.get(("p2", "v1")) == 3
+
+def test_prediction_started_before_invalidation_is_not_stored():
+    cache = PredictionCache(10)
+    with cache.loading("p1") as store:
+        # The patient is updated after its features were read
+        cache.invalidate("p1")
+        store(("p1", "v1"), "stale")
+    assert cache.get(("p1", "v1")) is None
+
+    with cache.loading("p1") as store:
+        store(("p1", "v1"), "fresh")
+    assert cache.get(("p1", "v1")) == "fresh"
+    assert not cache._loading
+
+def test_eviction_forgets_versions():
+    cache = PredictionCache(1)
+    cache.put(("p1", "v1"), 1)
+    cache.put(("p2", "v1"), 2)
+    assert "p1" not in cache._versions
+    cache.invalidate("p2")
+    assert cache.stats()["size"] == 0 and not cache._versions
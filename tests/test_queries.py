@@ -0,0 +1,173 @@
+"""The patient statements run against PostgreSQL (TEST_DATABASE_URL, see test_feature_stats.py)."""
+import asyncio
+import os
+from urllib.parse import urlsplit
+import pytest
+from app.repository import (
+    CREATE_PATIENT, EXPORT_SELECT, FEATURE_COLUMNS, FEATURE_SELECT, PATIENT_ROW_COLUMNS, PATIENT_SELECT, TUMOR_TABLES,
+)
+
+def features(value):
+    return [value] * len(FEATURE_COLUMNS)
+
+def tumor_rows(cursor, patient_id):
+    rows = {}
+    for table in TUMOR_TABLES:
+        cursor.execute(f"SELECT id, patient_id FROM {table} WHERE patient_id = %s", (patient_id,))
+        rows[table] = cursor.fetchall()
+    return rows
+
+def assert_created(cursor, patient_id):
+    for table, rows in tumor_rows(cursor, patient_id).items():
+        # One row per table, keyed by patient_id with its own serial id
+        assert len(rows) == 1, table
+        assert isinstance(rows[0][0], int)
+
+def test_create_patient(pg_cursor):
+    pg_cursor.execute(CREATE_PATIENT, ("create-1", "M", *features(1.0)))
+    assert pg_cursor.fetchone()[0] == "create-1"
+    assert_created(pg_cursor, "create-1")
+
+    # Without an ID one is allocated from the sequence
+    pg_cursor.execute(CREATE_PATIENT, (None, "B", *features(1.0)))
+    allocated = pg_cursor.fetchone()[0]
+    assert_created(pg_cursor, allocated)
+
+def test_create_patient_async(pg_cursor):
+    asyncpg = pytest.importorskip("asyncpg")
+    from app.async_database import CREATE_PATIENT as ASYNC_CREATE_PATIENT
+
+    async def create():
+        conn = await asyncpg.connect(os.environ["TEST_DATABASE_URL"])
+        try:
+            return await conn.fetchval(ASYNC_CREATE_PATIENT, "create-async", "M", *features(1.0))
+        finally:
+            await conn.close()
+
+    assert asyncio.run(create()) == "create-async"
+    assert_created(pg_cursor, "create-async")
+
+def test_fetch_patient_async(pg_cursor):
+    asyncpg = pytest.importorskip("asyncpg")
+    from app import async_database
+
+    pg_cursor.execute(CREATE_PATIENT, ("fetch-async", "M", *features(1.0)))
+
+    async def fetch():
+        # A single-connection pool: the whole lookup must fit on one checkout
+        async_database._pool = await asyncpg.create_pool(os.environ["TEST_DATABASE_URL"], min_size=1, max_size=1)
+        try:
+            record = await async_database.fetch_patient("fetch-async")
+            missing = await async_database.fetch_patient("fetch-missing")
+            return record, missing, async_database.pool_stats()
+        finally:
+            await async_database.close_async_pool()
+
+    record, missing, stats = asyncio.run(fetch())
+    assert record["patient"]["id"] == "fetch-async"
+    assert all(record[table]["patient_id"] == "fetch-async" for table in TUMOR_TABLES)
+    assert missing is None
+    assert stats["in_use"] == 0 and stats["idle"] == 1
+
+def test_patient_pages(pg_cursor):
+    for i in range(5):
+        pg_cursor.execute(CREATE_PATIENT, (f"page-{i}", "M", *features(float(i))))
+    pg_cursor.execute("DELETE FROM tumor_se WHERE patient_id = 'page-3'")
+
+    pages, after = [], 0
+    while True:
+        pg_cursor.execute(PATIENT_SELECT + " WHERE p.serial_id > %s ORDER BY p.serial_id LIMIT %s", (after, 2))
+        rows = pg_cursor.fetchall()
+        if not rows:
+            break
+        pages.append([row[PATIENT_ROW_COLUMNS.index("id")] for row in rows])
+        after = rows[-1][0]
+
+    assert pages == [["page-0", "page-1"], ["page-2", "page-3"], ["page-4"]]
+    pg_cursor.execute(PATIENT_SELECT + " WHERE p.id = 'page-3'")
+    row = dict(zip(PATIENT_ROW_COLUMNS, pg_cursor.fetchone()))
+    # The missing tumor_se row comes back from the LEFT JOIN as NULLs
+    assert row["radius_mean"] == 3.0 and row["radius_se"] is None
+
+def test_export(pg_cursor):
+    pg_cursor.execute(CREATE_PATIENT, ("export-1", "M", *features(1.5)))
+    pg_cursor.execute(CREATE_PATIENT, ("export-2", "B", *features(2.5)))
+    pg_cursor.execute(EXPORT_SELECT + " ORDER BY p.serial_id")
+    assert pg_cursor.fetchall() == [("export-1", "M", *features(1.5)), ("export-2", "B", *features(2.5))]
+
+@pytest.fixture
+def pg_repository(pg_cursor, monkeypatch):
+    """PostgresRepository whose pool points at TEST_DATABASE_URL."""
+    from app import database
+    from app.repository import PostgresRepository
+
+    url = urlsplit(os.environ["TEST_DATABASE_URL"])
+    for name, value in {
+        "DB_NAME": url.path.lstrip("/"), "DB_USER": url.username, "DB_PASSWORD": url.password,
+        "DB_HOST": url.hostname, "DB_PORT": url.port,
+    }.items():
+        if value is None:
+            monkeypatch.delenv(name, raising=False)
+        else:
+            monkeypatch.setenv(name, str(value))
+    repository = PostgresRepository()
+    repository.open()
+    try:
+        yield repository
+    finally:
+        repository.close()
+
+def test_export_chunks_release_their_connection(pg_cursor, pg_repository):
+    from app.database import pool_stats
+
+    pg_cursor.execute(CREATE_PATIENT, ("stream-1", "M", *features(1.0)))
+    pg_cursor.execute(CREATE_PATIENT, ("stream-2", "B", *features(2.0)))
+    assert [row for rows in pg_repository.export_chunks(1) for row in rows] == [
+        ("stream-1", "M", *features(1.0)), ("stream-2", "B", *features(2.0)),
+    ]
+    assert pool_stats()["in_use"] == 0
+
+    # A stream that is dropped before it is read gives its connection back too
+    chunks = pg_repository.export_chunks(1)
+    assert pool_stats()["in_use"] == 1
+    chunks.close()
+    assert pool_stats()["in_use"] == 0
+
+def test_feature_matrix_releases_its_connection(pg_cursor, pg_repository):
+    from app.database import pool_stats
+
+    pg_cursor.execute(CREATE_PATIENT, ("matrix-1", "M", *features(1.0)))
+    pg_cursor.execute(CREATE_PATIENT, ("matrix-2", "B", *features(2.0)))
+    pg_repository.refresh_features()
+    count, chunks = pg_repository.feature_matrix(1)
+    assert count == 2
+    assert [len(rows) for rows in chunks] == [1, 1]
+    assert pool_stats()["in_use"] == 0
+
+    count, chunks = pg_repository.feature_matrix(1)
+    chunks.close()
+    assert pool_stats()["in_use"] == 0
+
+def test_features(pg_cursor):
+    # A numeric-looking patient ID must not match another patient's serial tumor id
+    pg_cursor.execute(CREATE_PATIENT, ("feature-1", "M", *features(1.0)))
+    pg_cursor.execute(CREATE_PATIENT, ("1", "B", *features(2.0)))
+    pg_cursor.execute("DELETE FROM tumor_se WHERE patient_id = 'feature-1'")
+
+    pg_cursor.execute(FEATURE_SELECT, ("1",))
+    assert pg_cursor.fetchone() == tuple(features(2.0))
+    pg_cursor.execute(FEATURE_SELECT, ("feature-1",))
+    assert pg_cursor.fetchone() == (1.0,) * 10 + (None,) * 10 + (1.0,) * 10
+    pg_cursor.execute(FEATURE_SELECT, ("feature-2",))
+    assert pg_cursor.fetchone() is None
+
+def test_score_chunk_keeps_patients_missing_a_tumor_row(pg_cursor):
+    from app.scoring import SCORE_SELECT
+
+    pg_cursor.execute(CREATE_PATIENT, ("score-1", "M", *features(1.0)))
+    pg_cursor.execute(CREATE_PATIENT, ("score-2", "B", *features(2.0)))
+    pg_cursor.execute("DELETE FROM tumor_worst WHERE patient_id = 'score-1'")
+    pg_cursor.execute(SCORE_SELECT, (0, 2 ** 31 - 1, 10))
+    rows = {row[1]: row[2:] for row in pg_cursor.fetchall()}
+    # Missing features are scored as 0
+    assert rows == {"score-1": (1.0,) * 20 + (0.0,) * 10, "score-2": tuple(features(2.0))}
@@ -0,0 +1,117 @@
+import asyncio
+import fnmatch
+import pytest
+from app import cache
+from app.cache import MemoryBackend, RecordCache, RedisBackend
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+class FakeRedis:
+    """The slice of the redis.asyncio client RedisBackend uses, with PX expiry on `clock`."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+
+    async def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires_at, raw = entry
+        if expires_at <= self.clock.now:
+            del self.data[key]
+            return None
+        return raw
+
+    async def set(self, key, value, px):
+        self.data[key] = (self.clock.now + px / 1000, value.encode())
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, clock):
+    if request.param == "memory":
+        return MemoryBackend(10)
+    return RedisBackend(FakeRedis(clock))
+
+def loader(value, calls):
+    async def load():
+        calls.append(value)
+        return value
+    return load
+
+def test_get_and_set(backend):
+    async def run():
+        assert await backend.get("patient:1") is None
+        await backend.set("patient:1", {"patient": {"id": "1"}}, 5)
+        return await backend.get("patient:1")
+
+    assert asyncio.run(run()) == {"patient": {"id": "1"}}
+
+def test_entries_expire_after_the_ttl(backend, clock):
+    records = RecordCache(backend, ttl=5)
+    calls = []
+
+    async def run():
+        await records.get_or_load("patient:1", loader({"id": "1"}, calls))
+        clock.now += 4.9
+        await records.get_or_load("patient:1", loader({"id": "1"}, calls))
+        clock.now += 0.2
+        await records.get_or_load("patient:1", loader({"id": "1"}, calls))
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert records.stats()["hits"] == 1 and records.stats()["misses"] == 2
+
+def test_invalidate_and_clear(backend):
+    records = RecordCache(backend, ttl=5)
+    calls = []
+
+    async def run():
+        await records.get_or_load("patient:1", loader("one", calls))
+        await records.get_or_load("patient:2", loader("two", calls))
+        await records.invalidate("patient:1")
+        assert await backend.get("patient:1") is None
+        assert await backend.get("patient:2") == "two"
+        await records.clear()
+        assert await backend.get("patient:2") is None
+
+    asyncio.run(run())
+
+def test_load_started_before_an_invalidation_is_not_stored(backend):
+    records = RecordCache(backend, ttl=5)
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_load():
+            started.set()
+            await release.wait()
+            return "stale"
+
+        task = asyncio.ensure_future(records.get_or_load("patient:1", slow_load))
+        await started.wait()
+        # The patient is updated while its old row is still being read
+        await records.invalidate("patient:1")
+        release.set()
+        assert await task == "stale"
+        return await backend.get("patient:1")
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,31 @@
+"""The json fallback of app.serialization.dumps must match orjson byte for byte."""
+from datetime import date, datetime, timezone
+import numpy as np
+import pytest
+from app import serialization
+
+orjson = pytest.importorskip("orjson")
+
+CONTENT = {
+    "data": [
+        {
+            "patient": {"serial_id": 1, "id": "842302", "diagnosis": "M",
+                        "created_at": datetime(2025, 1, 1, 12, 0, 0, 123456)},
+            "tumor_mean": {"radius_mean": 17.99, "texture_mean": float("nan"), "area_mean": float("inf")},
+            "tumor_se": None,
+        },
+    ],
+    "scored_at": datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc),
+    "day": date(2025, 1, 1),
+    "columns": ("id", "diagnosis"),
+    "values": np.array([[1.5, np.nan], [2.25, 3.0]]),
+    "count": np.int64(7),
+    "mean": np.float64(0.125),
+    "name": "Élodie",
+    1: "non-string key",
+}
+
+def test_fallback_matches_orjson(monkeypatch):
+    expected = serialization.dumps(CONTENT)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(CONTENT) == expected